@@ -0,0 +1,79 @@
+"""
+Admission control for expensive endpoints (the streaming /api/chat).
+
+RateLimiter gives each client a token bucket, so one visitor or script cannot
+monopolise the assistant. ConcurrencyLimit caps the generations running at once
+in a worker process. Requests wait up to a short timeout for a free slot and are
+then turned away, rather than queueing behind minutes of streaming.
+
+Both are per worker process, like the other in-process caches.
+"""
+import threading
+import time
+
+class RateLimiter:
+    """Token buckets per key: `burst` requests at once, refilled at `rate` per second."""
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = {} # key -> (tokens, last update)
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """Takes a token for `key`. Returns (allowed, seconds until the next token)."""
+        if self.rate <= 0:
+            return True, 0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return False, (1 - tokens) / self.rate
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return True, 0
+
+    def _prune(self, now):
+        # A bucket that has refilled is the same as no bucket
+        full = [key for key, (tokens, updated) in self._buckets.items()
+                if tokens + (now - updated) * self.rate >= self.burst]
+        for key in full:
+            del self._buckets[key]
+        # Still too many clients at once: forget the oldest
+        if len(self._buckets) > self.max_keys:
+            oldest = sorted(self._buckets, key=lambda key: self._buckets[key][1])
+            for key in oldest[:len(self._buckets) - self.max_keys]:
+                del self._buckets[key]
+
+class ConcurrencyLimit:
+    """At most `limit` holders at once; acquire() waits up to `timeout` seconds for a slot."""
+
+    def __init__(self, limit, timeout):
+        self.limit = limit
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(limit) if limit > 0 else None
+        self._lock = threading.Lock()
+        self.active = 0
+        self.rejected = 0
+
+    def acquire(self):
+        if self._slots is None:
+            return True
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.active += 1
+        return True
+
+    def release(self):
+        if self._slots is None:
+            return
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
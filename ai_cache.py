@@ -0,0 +1,146 @@
+"""
+Persistent cache of DeepSeek output.
+
+Entries are keyed by (operation, target language, prompt version, SHA-256 of
+the input), so the same text is only ever sent to the API once per prompt
+version, whichever post, photo or setting it comes from. Bump the prompt
+version of an operation whenever its prompt changes.
+
+The table is capped at AI_CACHE_MAX_ENTRIES rows; the least recently used
+entries are evicted first. Hit/miss counts are kept per process (counters())
+and per entry (the `hits` column, shown by `flask ai-cache stats`).
+"""
+import hashlib
+import os
+import threading
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, select, delete, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, AICacheEntry
+
+PRUNE_EVERY = 100 # Stores between size checks
+
+_counters = {}
+_lock = threading.Lock()
+_stores = 0
+
+def init_app(app):
+    app.config.setdefault('AI_CACHE_MAX_ENTRIES', int(os.environ.get('AI_CACHE_MAX_ENTRIES', 20000)))
+    app.cli.add_command(ai_cache_cli)
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def _count(op, hits, misses):
+    with _lock:
+        counter = _counters.setdefault(op, {'hits': 0, 'misses': 0})
+        counter['hits'] += hits
+        counter['misses'] += misses
+
+def counters():
+    """{op: {'hits': n, 'misses': n}} for lookups made by this process."""
+    with _lock:
+        return {op: dict(counter) for op, counter in _counters.items()}
+
+def lookup(op, lang, prompt_version, texts):
+    """Returns {text: output} for the texts that are cached."""
+    hashes = {text_hash(t): t for t in texts}
+    if not hashes:
+        return {}
+    found = {}
+    used = []
+    keys = list(hashes)
+    # Chunked to stay under SQLite's bound-parameter limit
+    for i in range(0, len(keys), 500):
+        rows = db.session.query(AICacheEntry.id, AICacheEntry.input_hash, AICacheEntry.output).filter(
+            AICacheEntry.op == op,
+            AICacheEntry.lang == lang,
+            AICacheEntry.prompt_version == prompt_version,
+            AICacheEntry.input_hash.in_(keys[i:i + 500]),
+        ).all()
+        for entry_id, input_hash, output in rows:
+            found[hashes[input_hash]] = output
+            used.append(entry_id)
+    for i in range(0, len(used), 500):
+        db.session.execute(
+            update(AICacheEntry).where(AICacheEntry.id.in_(used[i:i + 500]))
+            .values(hits=AICacheEntry.hits + 1, last_used_at=datetime.utcnow())
+        )
+    if used:
+        db.session.commit()
+    _count(op, len(found), len(hashes) - len(found))
+    return found
+
+def store(op, lang, prompt_version, text, output):
+    global _stores
+    db.session.add(AICacheEntry(op=op, lang=lang, prompt_version=prompt_version, input_hash=text_hash(text), output=output))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback() # Another worker cached the same input first
+    with _lock:
+        _stores += 1
+        check = _stores % PRUNE_EVERY == 0
+    if check:
+        prune(current_app.config['AI_CACHE_MAX_ENTRIES'])
+
+def cached(op, lang, prompt_version, text, compute):
+    """Returns the cached output for `text`, or `compute(text)` stored for next time."""
+    found = lookup(op, lang, prompt_version, [text])
+    if text in found:
+        return found[text]
+    output = compute(text)
+    store(op, lang, prompt_version, text, output)
+    return output
+
+def prune(max_entries):
+    """Deletes the least recently used entries beyond `max_entries`. Returns the number deleted."""
+    excess = db.session.query(func.count(AICacheEntry.id)).scalar() - max_entries
+    if excess <= 0:
+        return 0
+    oldest = select(AICacheEntry.id).order_by(func.coalesce(AICacheEntry.last_used_at, AICacheEntry.created_at), AICacheEntry.id).limit(excess)
+    deleted = db.session.execute(delete(AICacheEntry).where(AICacheEntry.id.in_(oldest))).rowcount
+    db.session.commit()
+    return deleted
+
+ai_cache_cli = AppGroup('ai-cache', help='Inspect and manage the DeepSeek output cache.')
+
+@ai_cache_cli.command('stats')
+def stats_command():
+    """Show entries and hit ratio per operation/language/prompt version."""
+    rows = db.session.query(
+        AICacheEntry.op, AICacheEntry.lang, AICacheEntry.prompt_version,
+        func.count(AICacheEntry.id), func.sum(AICacheEntry.hits), func.sum(func.length(AICacheEntry.output)),
+    ).group_by(AICacheEntry.op, AICacheEntry.lang, AICacheEntry.prompt_version).all()
+    if not rows:
+        click.echo('Cache is empty.')
+    for op, lang, version, entries, hits, size in rows:
+        hits = hits or 0
+        # Every entry was a miss once, so hits / (hits + entries) is the lifetime hit ratio
+        click.echo(f"{op:<12} {lang:<4} v{version:<3} {entries:>7} entries {size or 0:>10} chars  "
+                   f"{hits:>8} hits  hit ratio {hits / (hits + entries):.0%}")
+    click.echo(f"Limit: {current_app.config['AI_CACHE_MAX_ENTRIES']} entries")
+
+@ai_cache_cli.command('prune')
+@click.option('--max-entries', type=int, default=None, help='Defaults to AI_CACHE_MAX_ENTRIES.')
+def prune_command(max_entries):
+    """Evict least recently used entries down to the size limit."""
+    if max_entries is None:
+        max_entries = current_app.config['AI_CACHE_MAX_ENTRIES']
+    click.echo(f"Deleted {prune(max_entries)} entries.")
+
+@ai_cache_cli.command('clear')
+@click.option('--op', default=None, help='Only clear this operation (e.g. translate, summary).')
+def clear_command(op):
+    """Delete cached output, e.g. after changing a prompt without bumping its version."""
+    query = AICacheEntry.query
+    if op:
+        query = query.filter_by(op=op)
+    count = query.delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f"Deleted {count} entries.")
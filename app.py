@@ -1,25 +1,48 @@
-from gevent import monkey
-monkey.patch_all()
-
 import os
-import requests
 import random
 import string
 import time
 import json
-import threading
-import uuid
-from datetime import timedelta, datetime
-from flask import Flask, render_template, request, redirect, url_for, flash, abort, send_from_directory, jsonify, session, Response, stream_with_context
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta, datetime, timezone
+from email.utils import format_datetime
+from flask import Flask, Request, render_template, request, redirect, url_for, flash, abort, send_from_directory, jsonify, session, Response, stream_with_context, g
 import jinja2
+import click
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from models import db, User, Post, Category, Photo, SiteSetting, OTP
-import markdown
-from openai import OpenAI
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy import tuple_, or_, update
+from sqlalchemy.orm import load_only, joinedload, defer
+from sqlalchemy.orm.attributes import flag_modified
+from models import db, User, Post, Category, Photo, SiteSetting, OTP, upgrade_schema
+from cache import ContentVersion, VersionedValue, PageCache, TTLCache
+from admission import RateLimiter, ConcurrencyLimit
+import images
+import translation
+import ai_cache
+import search
+import db_profile
+import metrics
+import profiling
+import photo_store
+from jobs import JobQueue
+from static_site import StaticSite
+from deepseek import DeepSeekClient
+# markdown (with Pygments via codehilite) and requests are imported where they are used, so
+# importing the app stays fast for the CLI and tooling; create_app() loads the rendering stack
+
+class BlogRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Photo uploads are hashed as they are written to disk, right where they will be stored (photo_store.py)
+        if self.endpoint == 'upload_photo':
+            return photo_store.HashingFile(os.path.join(app.config['UPLOAD_FOLDER'], 'photos'))
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
 
 app = Flask(__name__)
+app.request_class = BlogRequest
 
 # Configure Jinja2 to look in default template directory
 # We will rely on subdirectories 'code_black', 'simple_white', and 'templates_optional' for switching
@@ -32,11 +55,30 @@ app.jinja_loader = jinja2.ChoiceLoader([
 # change the secret key to a random string, you can use "openssl rand -hex 32"
 #app.config['SECRET_KEY'] = 'your_secret_key_here'
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your_secret_key_here')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///blog.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///blog.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static/uploads')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max-limit
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=14) # 14 days login session
+app.config['POSTS_PER_PAGE'] = int(os.environ.get('POSTS_PER_PAGE', 10)) # Posts per listing page / infinite scroll batch
+app.config['PHOTOS_PER_PAGE'] = int(os.environ.get('PHOTOS_PER_PAGE', 12)) # Photos per gallery page / infinite scroll batch
+app.config['PAGE_CACHE_MAX_ENTRIES'] = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 512)) # Rendered pages kept per worker
+app.config['PAGE_CACHE_MAX_BYTES'] = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+app.config['FEED_ENTRIES'] = int(os.environ.get('FEED_ENTRIES', 20)) # Newest posts in the Atom/RSS feeds
+app.config['PROXY_COUNT'] = int(os.environ.get('PROXY_COUNT', 0)) # Reverse proxies in front of the app (for client IPs)
+if app.config['PROXY_COUNT']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_COUNT'], x_proto=app.config['PROXY_COUNT'])
+else:
+    _proxy_warned = False
+
+    @app.before_request
+    def warn_unconfigured_proxy():
+        # Behind a proxy every visitor would share the proxy's address (one chat rate limit for all)
+        global _proxy_warned
+        if not _proxy_warned and 'X-Forwarded-For' in request.headers:
+            _proxy_warned = True
+            print(f"WARNING: request from {request.remote_addr} has X-Forwarded-For but PROXY_COUNT is 0; "
+                  "set PROXY_COUNT to the number of reverse proxies in front of the app, or all clients share one IP.")
 
 # Define template folder based on theme is handled dynamically, but Flask needs a default
 # We will override render_template behavior or pass the correct folder
@@ -53,7 +95,7 @@ def get_template_path(template_name):
     theme = session.get('theme')
     
     if not theme:
-        settings = SiteSetting.query.first()
+        settings = chrome_cache.get()['settings']
         if settings and settings.theme:
             # Map old values if necessary, or assume they match folder names
             # Old values: 'dark', 'white'
@@ -85,7 +127,7 @@ def toggle_theme():
     current_theme = session.get('theme')
     # Check SiteSetting if session is empty
     if not current_theme:
-        settings = SiteSetting.query.first()
+        settings = chrome_cache.get()['settings']
         if settings and settings.theme == 'white':
             current_theme = 'simple_white'
         else:
@@ -105,18 +147,38 @@ def toggle_theme():
 # DeepSeek Configuration
 DEEPSEEK_BASE_URL = 'https://api.deepseek.com'
 DEEPSEEK_API_KEY = 'use_your_own_key'
+app.config['DEEPSEEK_BASE_URL'] = os.environ.get('DEEPSEEK_BASE_URL', DEEPSEEK_BASE_URL)
+app.config['DEEPSEEK_MODEL'] = os.environ.get('DEEPSEEK_MODEL', 'deepseek-chat')
+app.config['DEEPSEEK_TIMEOUT'] = float(os.environ.get('DEEPSEEK_TIMEOUT', 120)) # Seconds per request (a full translation can take a while)
+app.config['DEEPSEEK_CONNECT_TIMEOUT'] = float(os.environ.get('DEEPSEEK_CONNECT_TIMEOUT', 10))
+app.config['DEEPSEEK_MAX_CONNECTIONS'] = int(os.environ.get('DEEPSEEK_MAX_CONNECTIONS', 20)) # Pool size per worker process
+app.config['DEEPSEEK_MAX_KEEPALIVE'] = int(os.environ.get('DEEPSEEK_MAX_KEEPALIVE', 10))
+app.config['DEEPSEEK_MAX_IN_FLIGHT'] = int(os.environ.get('DEEPSEEK_MAX_IN_FLIGHT', 8)) # Background requests in flight per worker process
+app.config['AI_POOL_SIZE'] = int(os.environ.get('AI_POOL_SIZE', 8)) # Threads (greenlets under gevent) running AI calls for jobs
+# /api/chat admission control, per worker process
+app.config['CHAT_RATE_PER_MINUTE'] = float(os.environ.get('CHAT_RATE_PER_MINUTE', 6)) # Sustained questions per client IP (0 disables)
+app.config['CHAT_BURST'] = int(os.environ.get('CHAT_BURST', 5)) # Questions a client can ask back to back
+app.config['CHAT_MAX_CONCURRENT'] = int(os.environ.get('CHAT_MAX_CONCURRENT', 16)) # Answers streaming at once (0 = no limit)
+app.config['CHAT_QUEUE_TIMEOUT'] = float(os.environ.get('CHAT_QUEUE_TIMEOUT', 3)) # Seconds to wait for a slot before answering 503
+app.config['CHAT_ANSWER_CACHE_TTL'] = float(os.environ.get('CHAT_ANSWER_CACHE_TTL', 600)) # Seconds first-turn answers are reused (0 disables)
+app.config['CHAT_ANSWER_CACHE_MAX_ENTRIES'] = int(os.environ.get('CHAT_ANSWER_CACHE_MAX_ENTRIES', 256))
 
 def get_deepseek_key(): 
-    # Try database first
+    # Try database first, via the cached settings snapshot (no query unless settings changed)
     with app.app_context():
         try:
-            settings = SiteSetting.query.first()
+            settings = chrome_cache.get()['settings']
             if settings and settings.deepseek_api_key:
                 return settings.deepseek_api_key
         except:
             pass
-    # Fallback to hardcoded (or env var)
-    return DEEPSEEK_API_KEY
+    # Fallback to env var or hardcoded
+    return os.environ.get('DEEPSEEK_API_KEY', DEEPSEEK_API_KEY)
+
+# One pooled client per process, rebuilt when the key saved through /settings changes
+deepseek = DeepSeekClient.from_config(app.config, get_deepseek_key, on_call=metrics.record_ai_call)
+ai_cache.init_app(app) # Cache of DeepSeek output, AI_CACHE_MAX_ENTRIES rows
+search.init_app(app) # Full-text search and post retrieval for the chat assistant
 
 # # Configuration for SMS Login
 # ALLOWED_PHONE = 'use_your_own_phone'
@@ -129,6 +191,9 @@ Spug_SMS_Template_Code = 'use_your_own_Spug_template_code'
 # OTP_STORE = {} # Removed in favor of DB storage
 
 db.init_app(app)
+db_profile.init_app(app, db) # WAL, busy timeout and cache PRAGMAs on SQLite (SQLITE_PROFILE)
+metrics.init_app(app, db) # Server-Timing headers and /metrics (Prometheus)
+profiling.init_app(app) # cProfile traces of sampled slow requests (PROFILE_RATE)
 
 login_manager = LoginManager()
 login_manager.login_view = 'login'
@@ -140,33 +205,116 @@ def load_user(user_id):
 
 import re
 
-# ... (existing code)
+# Site chrome (settings, category menu, notifications) is read by every template render.
+# It is cached per process and reloaded only after content_version.bump(), which the
+# write routes call after committing, so steady-state page views run no queries for it.
+os.makedirs(app.instance_path, exist_ok=True)
+content_version = ContentVersion(os.path.join(app.instance_path, 'content_version'))
 
-@app.context_processor
-def inject_site_settings():
-    settings = SiteSetting.query.first()
-    if not settings:
-        settings = SiteSetting() # Default
-    
-    # Get current language from session, default to 'zh'
-    current_lang = session.get('lang', 'zh')
-    
-    # Parse notifications
+def parse_notifications(notification_content):
+    import markdown
     notifications = []
-    if settings.notification_content:
+    if notification_content:
         # Extract content between <notice> tags
-        matches = re.findall(r'<notice>(.*?)</notice>', settings.notification_content, re.DOTALL)
+        matches = re.findall(r'<notice>(.*?)</notice>', notification_content, re.DOTALL)
         if matches:
             for match in matches:
                 notifications.append(markdown.markdown(match.strip()))
-        elif settings.notification_content.strip():
+        elif notification_content.strip():
             # Fallback: if no tags, treat entire content as one notice
-            notifications.append(markdown.markdown(settings.notification_content.strip()))
+            notifications.append(markdown.markdown(notification_content.strip()))
+    return notifications
+
+def load_chrome():
+    settings = SiteSetting.query.first()
+    if settings:
+        # Detached copy: safe to share across requests and threads
+        settings = SiteSetting(**{c.name: getattr(settings, c.name) for c in SiteSetting.__table__.columns})
+    return {
+        'settings': settings,
+        'categories': [Category(id=c.id, name=c.name) for c in Category.query.all()],
+        'notifications': parse_notifications(settings.notification_content if settings else None),
+    }
+
+chrome_cache = VersionedValue(content_version, load_chrome)
+
+@app.context_processor
+def inject_site_settings():
+    chrome = chrome_cache.get()
+    settings = chrome['settings'] or SiteSetting() # Default
+    
+    # Get current language from session, default to 'zh'
+    current_lang = session.get('lang', 'zh')
+
+    return dict(site_settings=settings, all_categories=chrome['categories'], current_lang=current_lang, global_notifications=chrome['notifications'])
 
-    return dict(site_settings=settings, all_categories=Category.query.all(), current_lang=current_lang, global_notifications=notifications)
+# Full-page cache for anonymous readers
+# Reader pages depend only on the URL, the language and the theme, so they are cached per
+# worker and invalidated by content_version like the chrome above. Every cacheable response
+# carries a strong ETag and Last-Modified, so repeat visits revalidate to a 304.
+CACHEABLE_ENDPOINTS = {'index', 'post', 'about', 'gallery', 'api_posts', 'api_photos', 'search_page', 'api_search'}
+page_cache = PageCache(app.config['PAGE_CACHE_MAX_ENTRIES'], app.config['PAGE_CACHE_MAX_BYTES'])
+
+def page_cache_key():
+    if request.method != 'GET' or request.endpoint not in CACHEABLE_ENDPOINTS:
+        return None
+    # Admin pages show edit controls, and pending flash messages are one-off
+    if '_flashes' in session or current_user.is_authenticated:
+        return None
+    return (request.full_path, session.get('lang', 'zh'), get_template_path(''))
+
+def conditional_page(response, entry, per_reader=True):
+    response.set_etag(entry.etag)
+    if entry.last_modified:
+        response.last_modified = entry.last_modified
+    response.headers['Cache-Control'] = 'no-cache' # Always revalidate, usually to a 304
+    if per_reader:
+        response.vary.add('Cookie') # Language/theme live in the session cookie
+    return response.make_conditional(request)
+
+@app.before_request
+def serve_cached_page():
+    g.page_cache_key = page_cache_key()
+    if g.page_cache_key is None:
+        return None
+    g.page_version = content_version.get()
+    entry = page_cache.get(g.page_cache_key, g.page_version)
+    if entry:
+        g.page_cache_key = None # Nothing to store
+        return conditional_page(Response(entry.body, mimetype=entry.mimetype), entry)
+
+@app.after_request
+def store_cached_page(response):
+    key = g.get('page_cache_key')
+    if key is None or response.status_code != 200 or response.direct_passthrough:
+        return response
+    entry = page_cache.put(key, g.page_version, response.get_data(), response.mimetype)
+    return conditional_page(response, entry)
+
+# Markdown rendering
+# Post bodies and the about page are rendered when they are written and stored as HTML,
+# so page views only read a string. Bump RENDERER_VERSION whenever the rendering changes
+# (extensions, options) and run `flask render-html` to refresh stored HTML.
+MARKDOWN_EXTENSIONS = ['fenced_code', 'codehilite']
+RENDERER_VERSION = 1
+
+def render_markdown(text):
+    import markdown
+    return markdown.markdown(text or '', extensions=MARKDOWN_EXTENSIONS)
+
+def render_post_html(post):
+    post.content_html = render_markdown(post.content)
+    post.content_en_html = render_markdown(post.content_en) if post.content_en else None
+    post.html_version = RENDERER_VERSION
+
+def render_about_html(settings):
+    settings.about_content_html = render_markdown(settings.about_content)
+    settings.about_content_en_html = render_markdown(settings.about_content_en) if settings.about_content_en else None
+    settings.about_html_version = RENDERER_VERSION
 
 # Helper function to send SMS
 def send_sms_code(phone, code):
+    import requests
     url = f'https://push.spug.cc/sms/{Spug_SMS_Template_Code}'
     body = {'code': code, 'to': phone}
     try:
@@ -176,42 +324,42 @@ def send_sms_code(phone, code):
         print(f"Error sending SMS: {e}")
         return False
 
+# DeepSeek output is cached by (operation, language, prompt version, hash of the input) in
+# ai_cache.py, so unchanged titles, bodies and the about page never go back to the API.
+# Bump the version whenever a prompt below changes.
+TRANSLATE_PROMPT_VERSION = 1
+SUMMARY_PROMPT_VERSION = 1
+
 # Helper function to translate text using DeepSeek
 def translate_text(text):
     if not text:
         return ""
-    
-    api_key = get_deepseek_key()
-    client = OpenAI(
-        api_key=api_key,
-        base_url=DEEPSEEK_BASE_URL
-    )
-    
+    with app.app_context():
+        return ai_cache.cached('translate', 'en', TRANSLATE_PROMPT_VERSION, text, request_translation)
+
+def request_translation(text):
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
+        response = deepseek.chat(
             messages=[
                 {"role": "system", "content": "You are a professional translator. Translate the following blog content from Chinese to English. Maintain all Markdown formatting, code blocks, and links exactly as they are. Do not add any conversational filler or explanations. Just output the translation."},
                 {"role": "user", "content": text},
             ],
-            stream=False
+            stream=False,
+            op='translate'
         )
         return response.choices[0].message.content
     except Exception as e:
         print(f"Translation Error: {e}")
-        return text # Fallback to original if failed
+        raise # The job queue retries with backoff
 
 # Helper function to generate summary
 def generate_summary(text, lang='zh'):
     if not text:
         return ""
-    
-    api_key = get_deepseek_key()
-    client = OpenAI(
-        api_key=api_key,
-        base_url=DEEPSEEK_BASE_URL
-    )
-    
+    with app.app_context():
+        return ai_cache.cached('summary', lang, SUMMARY_PROMPT_VERSION, text, lambda text: request_summary(text, lang))
+
+def request_summary(text, lang):
     system_prompt = ""
     if lang == 'zh':
         system_prompt = "你是一个专业的文章摘要生成助手。请阅读以下文章内容，生成一个简短的中文摘要（100字以内）。摘要应精炼、吸引人。直接输出摘要内容，不要加任何前缀或解释。"
@@ -219,19 +367,82 @@ def generate_summary(text, lang='zh'):
         system_prompt = "You are a professional article summary assistant. Please read the following article content and generate a short English summary (within 100 words). The summary should be concise and engaging. Output the summary directly without any prefix or explanation."
 
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
+        response = deepseek.chat(
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": text},
             ],
-            stream=False
+            stream=False,
+            op='summary'
         )
         return response.choices[0].message.content
     except Exception as e:
         print(f"Summary Generation Error ({lang}): {e}")
+        raise # The job queue retries with backoff
+
+# The independent AI calls of one job (title, content, summaries) run concurrently on this
+# shared pool, so a post is done after its slowest call instead of the sum of all of them.
+ai_pool = ThreadPoolExecutor(max_workers=app.config['AI_POOL_SIZE'], thread_name_prefix='ai')
+
+def run_ai_tasks(tasks, save):
+    """
+    Runs {field: (func, *args)} concurrently and passes each result to `save(field, value)`
+    as soon as it arrives, so e.g. the English title shows up before the full translation.
+    `save` returns False when the source changed in the meantime; the remaining results
+    are then dropped and False is returned. If a call fails, the others are still saved
+    and the first error is raised at the end; the job retry then only redoes the missing fields.
+    """
+    futures = {ai_pool.submit(func, *args): field for field, (func, *args) in tasks.items()}
+    error = None
+    for future in as_completed(futures):
+        try:
+            value = future.result()
+        except Exception as e:
+            error = error or e
+            continue
+        if not save(futures[future], value):
+            for other in futures:
+                other.cancel()
+            return False
+    if error:
+        raise error
+    return True
+
+# Columns an AI job writes for a post (directly, or through refresh_excerpts)
+AI_POST_FIELDS = ('title_en', 'content_en', 'content_en_html', 'excerpt_en', 'summary_zh', 'summary_en')
+
+def save_if_current(model, obj_id, condition, values, after=None):
+    """
+    Writes `values` to row `obj_id` in one short transaction, only if `condition` (the source
+    text the AI calls were made from is still current) holds at that moment. `after(obj)` can
+    update derived data in the same transaction. Returns False, writing nothing, if it doesn't.
+    """
+    updated = db.session.execute(
+        update(model).where(model.id == obj_id, condition).values(**values)
+    ).rowcount
+    if not updated:
+        db.session.rollback()
+        return False
+    if after:
+        after(db.session.get(model, obj_id))
+    db.session.commit()
+    content_version.bump()
+    return True
+
+# Long Markdown bodies are translated block by block (translation.py). Blocks run on their own
+# pool: they are submitted from tasks already running on ai_pool, which must not wait on itself.
+block_pool = ThreadPoolExecutor(max_workers=app.config['AI_POOL_SIZE'], thread_name_prefix='ai-block')
+
+def translate_markdown(text):
+    if not text:
         return ""
+    with app.app_context():
+        return translation.translate_markdown(text, request_translation, block_pool, prompt_version=TRANSLATE_PROMPT_VERSION)
 
+# The async_process_* workers read what they need and close the session before calling the
+# API, so no connection or transaction is held for the seconds a call takes. Each result is
+# then written with save_if_current(), and results for text edited in the meantime are
+# discarded (the edit queued a new job for the new text).
 def async_process_post(app, post_id):
     with app.app_context():
         post = Post.query.get(post_id)
@@ -239,24 +450,39 @@ def async_process_post(app, post_id):
             return
             
         print(f"Starting AI processing for post {post_id}...")
+        revision = post.revision
         
+        tasks = {}
         # 1. Translate Title
         if not post.title_en:
-            post.title_en = translate_text(post.title)
+            tasks['title_en'] = (translate_text, post.title)
             
         # 2. Translate Content
         if not post.content_en:
-            post.content_en = translate_text(post.content)
+            tasks['content_en'] = (translate_markdown, post.content)
             
         # 3. Generate Summaries
         if not post.summary_zh:
-            post.summary_zh = generate_summary(post.content, 'zh')
+            tasks['summary_zh'] = (generate_summary, post.content, 'zh')
             
         if not post.summary_en:
-            post.summary_en = generate_summary(post.content, 'en')
-            
-        db.session.commit()
-        print(f"AI processing completed for post {post_id}.")
+            tasks['summary_en'] = (generate_summary, post.content, 'en')
+        db.session.close()
+
+        def refresh(post):
+            post.refresh_excerpts()
+            search.index_post(post)
+
+        def save(field, value):
+            values = {field: value}
+            if field == 'content_en':
+                values['content_en_html'] = render_markdown(value) # Before the write transaction starts
+            return save_if_current(Post, post_id, Post.revision == revision, values, after=refresh)
+
+        if run_ai_tasks(tasks, save):
+            print(f"AI processing completed for post {post_id}.")
+        else:
+            print(f"Post {post_id} was edited during AI processing; results discarded.")
 
 def async_process_photo(app, photo_id):
     with app.app_context():
@@ -266,14 +492,40 @@ def async_process_photo(app, photo_id):
         
         print(f"Starting AI processing for photo {photo_id}...")
         
+        tasks = {}
+        sources = {} # Field -> condition that its source text is unchanged
         if photo.title and not photo.title_en:
-            photo.title_en = translate_text(photo.title)
+            tasks['title_en'] = (translate_text, photo.title)
+            sources['title_en'] = Photo.title == photo.title
             
         if photo.description and not photo.description_en:
-            photo.description_en = translate_text(photo.description)
-            
-        db.session.commit()
-        print(f"AI processing completed for photo {photo_id}.")
+            tasks['description_en'] = (translate_text, photo.description)
+            sources['description_en'] = Photo.description == photo.description
+        db.session.close()
+
+        def save(field, value):
+            return save_if_current(Photo, photo_id, sources[field], {field: value})
+
+        if run_ai_tasks(tasks, save):
+            print(f"AI processing completed for photo {photo_id}.")
+        else:
+            print(f"Photo {photo_id} changed during AI processing; results discarded.")
+
+def build_photo_variants(photo):
+    """Generates the resized gallery copies of a photo (see images.py). Returns True on success."""
+    result = images.build_variants(os.path.join(app.config['UPLOAD_FOLDER'], 'photos'), photo.filename)
+    if not result:
+        return False
+    photo.width, photo.height, widths = result
+    photo.variant_widths = ','.join(str(w) for w in widths)
+    return True
+
+def async_build_photo_variants(app, photo_id):
+    with app.app_context():
+        photo = Photo.query.get(photo_id)
+        if photo and build_photo_variants(photo):
+            db.session.commit()
+            content_version.bump()
 
 def async_process_settings(app):
     with app.app_context():
@@ -282,42 +534,134 @@ def async_process_settings(app):
             return
             
         print("Starting AI processing for site settings...")
+        settings_id, about = settings.id, settings.about_content
+        db.session.close()
         
-        if settings.about_content:
-            # Always re-translate if content exists, or you could check if changed
-            # For simplicity, we assume if this is called, we want to translate
-            settings.about_content_en = translate_text(settings.about_content)
-            
-        db.session.commit()
+        if about:
+            # Unchanged blocks come from the translation cache
+            about_en = translate_markdown(about)
+            values = {'about_content_en': about_en, 'about_content_en_html': render_markdown(about_en)}
+            if not save_if_current(SiteSetting, settings_id, SiteSetting.about_content == about, values):
+                print("About text was edited during AI processing; translation discarded.")
+                return
         print("AI processing completed for site settings.")
 
+# Background jobs
+# The async_process_* functions run on the persistent job queue (jobs.py) instead of ad-hoc
+# threads: a fixed worker pool per process, retries with backoff, and repeated edits of the
+# same object coalesce into one pending job. Inspect it with `flask jobs status`.
+job_queue = JobQueue(app)
+
+@job_queue.handler('process_post')
+def process_post_job(post_id):
+    async_process_post(app, post_id)
+    queue_export('export_post', post_id)
+
+@job_queue.handler('process_photo')
+def process_photo_job(photo_id):
+    async_process_photo(app, photo_id)
+    queue_export('export_gallery')
+
+@job_queue.handler('photo_variants')
+def photo_variants_job(photo_id):
+    async_build_photo_variants(app, photo_id)
+    queue_export('export_gallery')
+
+@job_queue.handler('process_settings')
+def process_settings_job(_):
+    async_process_settings(app)
+    queue_export('export_about')
+
+# Static export (static_site.py)
+# With STATIC_EXPORT_DIR set, reader pages are also written as files for nginx. Every write
+# queues a job that re-renders just the pages it changed; settings change the chrome of
+# every page (and new categories the menu), so those rebuild the whole site.
+static_site = StaticSite(app, resolve_theme=lambda: get_template_path('').rstrip('/'))
+
+def queue_export(kind, target_id=None):
+    if static_site.enabled:
+        job_queue.enqueue(kind, target_id)
+
+@job_queue.handler('export_post')
+def export_post_job(post_id):
+    static_site.export_post(post_id)
+
+@job_queue.handler('export_category')
+def export_category_job(category_id):
+    static_site.export_category(category_id)
+
+@job_queue.handler('export_gallery')
+def export_gallery_job(_):
+    static_site.export_page('/gallery')
+
+@job_queue.handler('export_about')
+def export_about_job(_):
+    static_site.export_page('/about')
+
+@job_queue.handler('export_site')
+def export_site_job(_):
+    static_site.build()
+
+@app.before_request
+def start_job_workers():
+    # Picks up jobs left over from before a restart; a no-op once running in this process
+    job_queue.start()
+
 # Routes
-def get_blog_context():
+ABOUT_CONTEXT_CHARS = 1000 # About text included in the chat prompt
+
+def get_blog_context(question):
     """
-    Aggregates blog content for AI context.
+    Aggregates blog content for AI context: the site basics plus the post chunks most
+    relevant to `question` (search.py), within about CHAT_CONTEXT_TOKENS in all.
     """
     context_parts = []
     
-    # 1. Site Settings (Basic Info)
-    settings = SiteSetting.query.first()
+    # 1. Site Settings (Basic Info), from the cached snapshot
+    settings = chrome_cache.get()['settings']
     if settings:
         context_parts.append(f"Blog Name: {settings.blog_name}")
-        context_parts.append(f"About Content: {settings.about_content}")
+        context_parts.append(f"About Content: {(settings.about_content or '')[:ABOUT_CONTEXT_CHARS]}")
     
-    # 2. Posts (Limit to last 10 to avoid token limits, simplified)
-    posts = Post.query.order_by(Post.created_at.desc()).limit(10).all()
-    if posts:
-        context_parts.append("\nRecent Articles:")
-        for post in posts:
-            # Build absolute URL (assuming standard route)
-            # Note: We can't use url_for easily outside request context without application context, 
-            # but here we are inside a request usually.
-            post_url = url_for('post', post_id=post.id, _external=True)
-            summary = post.summary_zh if post.summary_zh else (post.content[:200] + "...")
-            context_parts.append(f"- Title: {post.title}\n  URL: {post_url}\n  Summary: {summary}")
+    # 2. Relevant post excerpts, any age, in what is left of the budget
+    # (the best excerpt keeps a share of it when the About text is long)
+    budget = app.config['CHAT_CONTEXT_TOKENS']
+    basics = search.estimate_tokens("\n\n".join(context_parts))
+    chunks = search.retrieve(question, token_budget=max(budget - basics, budget // 3))
+    if chunks:
+        context_parts.append("\nRelevant Article Excerpts:")
+        urls = {}
+        for chunk in chunks:
+            if chunk['post_id'] not in urls:
+                urls[chunk['post_id']] = url_for('post', post_id=chunk['post_id'], _external=True)
+            context_parts.append(f"- Title: {chunk['title']}\n  URL: {urls[chunk['post_id']]}\n  Excerpt: {chunk['chunk']}")
+    else:
+        # Nothing matched (greetings, or no search index): list the newest posts instead
+        posts = Post.query.options(load_only(Post.id, Post.title, Post.summary_zh, Post.excerpt)).order_by(Post.created_at.desc()).limit(5).all()
+        if posts:
+            context_parts.append("\nRecent Articles:")
+            for post in posts:
+                post_url = url_for('post', post_id=post.id, _external=True)
+                summary = post.summary_zh if post.summary_zh else ((post.excerpt or '') + "...")
+                context_parts.append(f"- Title: {post.title}\n  URL: {post_url}\n  Summary: {summary}")
             
     return "\n\n".join(context_parts)
 
+chat_limiter = RateLimiter(app.config['CHAT_RATE_PER_MINUTE'] / 60, app.config['CHAT_BURST'])
+chat_slots = ConcurrencyLimit(app.config['CHAT_MAX_CONCURRENT'], app.config['CHAT_QUEUE_TIMEOUT'])
+chat_answers = TTLCache(app.config['CHAT_ANSWER_CACHE_MAX_ENTRIES'], app.config['CHAT_ANSWER_CACHE_TTL'])
+
+def normalize_question(text):
+    # "What is this blog about?" and "what is this blog about" share an answer
+    text = unicodedata.normalize('NFKC', text).lower()
+    return ' '.join(text.split()).rstrip('?!.。？！~ ')
+
+def chat_unavailable(message, status, retry_after):
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response
+
 @app.route('/api/chat', methods=['POST'])
 def chat_api():
     data = request.get_json()
@@ -326,15 +670,30 @@ def chat_api():
     
     if not user_message:
         return jsonify({'error': 'Message is required'}), 400
-        
-    api_key = get_deepseek_key()
-    client = OpenAI(
-        api_key=api_key,
-        base_url=DEEPSEEK_BASE_URL
-    )
-    
-    # Construct system prompt with context
-    site_context = get_blog_context()
+
+    allowed, retry_after = chat_limiter.allow(request.remote_addr)
+    if not allowed:
+        return chat_unavailable('Too many questions, please wait a moment.', 429, retry_after)
+
+    # Opening questions repeat a lot; answers are reused until the content changes
+    cache_key = None
+    if not any(isinstance(msg, dict) and msg.get('role') == 'user' for msg in history):
+        cache_key = (normalize_question(user_message), session.get('lang', 'zh'), content_version.get())
+        answer = chat_answers.get(cache_key)
+        if answer is not None:
+            return Response(answer, mimetype='text/plain')
+
+    # Each answer holds a greenlet and an upstream stream until it is done
+    if not chat_slots.acquire():
+        return chat_unavailable('The assistant is busy, please try again shortly.', 503, app.config['CHAT_QUEUE_TIMEOUT'])
+    try:
+        # Construct system prompt with context
+        # Retrieve on the question, plus the previous one for follow-ups like "tell me more"
+        previous = [msg.get('content') or '' for msg in history if isinstance(msg, dict) and msg.get('role') == 'user'][-1:]
+        site_context = get_blog_context(' '.join(previous + [user_message]))
+    except Exception:
+        chat_slots.release()
+        raise
     system_prompt = f"""You are a helpful AI assistant for this blog. 
     Your goal is to assist visitors by answering questions based on the blog's content.
     
@@ -357,20 +716,25 @@ def chat_api():
     messages.append({"role": "user", "content": user_message})
     
     def generate():
+        parts = []
         try:
-            response = client.chat.completions.create(
-                model="deepseek-chat",
-                messages=messages,
-                stream=True
-            )
+            response = deepseek.chat(messages=messages, stream=True)
             for chunk in response:
                 if chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
                     yield chunk.choices[0].delta.content
         except Exception as e:
             print(f"Chat API Error: {e}")
             yield f"Error: {str(e)}"
+            return
+        # Only complete answers are cached (not errors, not streams the visitor closed)
+        if cache_key and parts:
+            chat_answers.put(cache_key, ''.join(parts))
 
-    return Response(stream_with_context(generate()), mimetype='text/plain')
+    response = Response(stream_with_context(generate()), mimetype='text/plain')
+    # The slot is held until the stream ends or the visitor disconnects
+    response.call_on_close(chat_slots.release)
+    return response
 
 @app.route('/set_lang/<lang>')
 def set_lang(lang):
@@ -378,56 +742,321 @@ def set_lang(lang):
         session['lang'] = lang
     return redirect(request.referrer or url_for('index'))
 
-@app.route('/')
-def index():
+# Keyset pagination
+# Listings are ordered newest first on (created_at, id). A cursor encodes the position of the
+# last item on a page, so fetching any page is a single indexed range scan instead of OFFSET.
+def encode_cursor(item):
+    return f"{item.created_at.strftime('%Y%m%d%H%M%S%f')}-{item.id}"
+
+def decode_cursor(cursor):
+    try:
+        stamp, item_id = cursor.split('-')
+        return datetime.strptime(stamp, '%Y%m%d%H%M%S%f'), int(item_id)
+    except (AttributeError, ValueError):
+        return None
+
+def keyset_page(query, model, cursor, per_page):
+    """
+    Returns (items, next_cursor) for one page of `query`.
+    next_cursor is None on the last page.
+    """
+    query = query.order_by(model.created_at.desc(), model.id.desc())
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        query = query.filter(tuple_(model.created_at, model.id) < position)
+    # Fetch one extra row to know whether another page exists
+    items = query.limit(per_page + 1).all()
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor(items[-1])
+    return items, next_cursor
+
+def post_relations():
+    """
+    Eager-load options for the category name and author username shown with every post,
+    so a page of N posts costs one query instead of 1 + 2N.
+    """
+    return (
+        joinedload(Post.category).load_only(Category.name),
+        joinedload(Post.author).load_only(User.username),
+    )
+
+def get_post_page():
+    """
+    Reads category/cursor from the query string and returns (posts, next_cursor, category_id).
+    Shared by the index page and its JSON variant.
+    """
     category_id = request.args.get('category', type=int)
+    # Cards only show title, excerpt/summary and meta; keep the Markdown bodies in SQLite
+    query = Post.query.options(load_only(
+        Post.title, Post.title_en, Post.excerpt, Post.excerpt_en, Post.summary_zh, Post.summary_en,
+        Post.created_at, Post.custom_author, Post.author_id, Post.category_id
+    ), *post_relations())
     if category_id:
-        posts = Post.query.filter_by(category_id=category_id).order_by(Post.created_at.desc()).all()
-        active_category = Category.query.get(category_id)
-    else:
-        posts = Post.query.order_by(Post.created_at.desc()).all()
-        active_category = None
-    return render_template(get_template_path('index.html'), posts=posts, active_category=active_category)
+        query = query.filter_by(category_id=category_id)
+    posts, next_cursor = keyset_page(query, Post, request.args.get('cursor'), app.config['POSTS_PER_PAGE'])
+    return posts, next_cursor, category_id
+
+@app.route('/')
+def index():
+    posts, next_cursor, category_id = get_post_page()
+    active_category = Category.query.get(category_id) if category_id else None
+    return render_template(get_template_path('index.html'), posts=posts, active_category=active_category,
+                           next_cursor=next_cursor, category_id=category_id)
+
+@app.route('/api/posts')
+def api_posts():
+    """
+    JSON variant of the index listing for infinite scroll.
+    Besides the post metadata it returns the rendered cards for the current theme,
+    so the page can append them without duplicating the markup in JavaScript.
+    """
+    posts, next_cursor, category_id = get_post_page()
+    lang = session.get('lang', 'zh')
+    items = []
+    for post in posts:
+        use_en = lang == 'en' and post.title_en
+        items.append({
+            'id': post.id,
+            'title': post.title_en if use_en else post.title,
+            'excerpt': post.excerpt_en if lang == 'en' and post.excerpt_en else post.excerpt,
+            'url': url_for('post', post_id=post.id),
+            'created_at': post.created_at.isoformat(),
+            'category': post.category.name if post.category else None,
+            'author': post.custom_author or post.author.username,
+        })
+    return jsonify({
+        'posts': items,
+        'html': render_template(get_template_path('_post_cards.html'), posts=posts),
+        'next_cursor': next_cursor,
+        'next_url': url_for('api_posts', category=category_id, cursor=next_cursor) if next_cursor else None,
+    })
 
 @app.route('/post/<int:post_id>')
 def post(post_id):
-    post = Post.query.get_or_404(post_id)
+    # Bodies are only needed if the stored HTML is stale
+    post = Post.query.options(defer(Post.content), defer(Post.content_en), *post_relations()).get_or_404(post_id)
+    fresh = post.html_version == RENDERER_VERSION
     
     # Choose content based on language
     lang = session.get('lang', 'zh')
-    if lang == 'en' and post.content_en:
-        content_to_render = post.content_en
+    if lang == 'en' and (post.content_en_html if fresh else post.content_en):
+        post.html_content = post.content_en_html if fresh else render_markdown(post.content_en)
         post.display_title = post.title_en or post.title
     else:
-        content_to_render = post.content
+        post.html_content = post.content_html if fresh else render_markdown(post.content)
         post.display_title = post.title
         
-    post.html_content = markdown.markdown(content_to_render, extensions=['fenced_code', 'codehilite'])
     return render_template(get_template_path('post.html'), post=post)
 
 @app.route('/about')
 def about():
-    settings = SiteSetting.query.first()
+    settings = chrome_cache.get()['settings']
     if not settings:
         content = "About content not initialized."
         social_links = []
     else:
         # Choose content based on language
         lang = session.get('lang', 'zh')
+        fresh = settings.about_html_version == RENDERER_VERSION
         if lang == 'en' and settings.about_content_en:
-            content_to_render = settings.about_content_en
+            content = settings.about_content_en_html if fresh else render_markdown(settings.about_content_en)
         else:
-            content_to_render = settings.about_content
-            
-        content = markdown.markdown(content_to_render, extensions=['fenced_code', 'codehilite'])
+            content = settings.about_content_html if fresh else render_markdown(settings.about_content)
         social_links = settings.get_social_links()
         
     return render_template(get_template_path('about.html'), content=content, social_links=social_links)
 
+# Full-text search (search.py)
+SEARCH_MAX_PAGES = 50 # Deeper pages are not useful and cost an ever larger OFFSET
+
+def get_search_page():
+    """
+    Reads q/page from the query string and returns (query, results, page, has_next).
+    Each result is a dict with the post and its highlighted title and snippet in the
+    reader's language, falling back to the other language where the match is.
+    """
+    query = request.args.get('q', '').strip()[:100]
+    page = min(max(request.args.get('page', 1, type=int), 1), SEARCH_MAX_PAGES)
+    ids, has_next = search.search_posts(query, page, app.config['POSTS_PER_PAGE'])
+    if not ids:
+        return query, [], page, False
+    posts = Post.query.options(load_only(
+        Post.title, Post.title_en, Post.content, Post.content_en, Post.excerpt, Post.excerpt_en,
+        Post.created_at, Post.custom_author, Post.author_id, Post.category_id
+    ), *post_relations()).filter(Post.id.in_(ids)).all()
+    by_id = {post.id: post for post in posts}
+    use_en = session.get('lang', 'zh') == 'en'
+    results = []
+    for post_id in ids:
+        post = by_id.get(post_id)
+        if not post:
+            continue
+        title = post.title_en if use_en and post.title_en else post.title
+        bodies = [post.content_en, post.content] if use_en else [post.content, post.content_en]
+        excerpt = post.excerpt_en if use_en and post.excerpt_en else post.excerpt
+        snippet = next(filter(None, (search.snippet(body, query) for body in bodies)), None)
+        results.append({
+            'post': post,
+            'title_html': search.highlight(title, query),
+            'snippet_html': snippet or search.highlight((excerpt or '') + '...', query),
+        })
+    return query, results, page, has_next and page < SEARCH_MAX_PAGES
+
+@app.route('/search')
+def search_page():
+    query, results, page, has_next = get_search_page()
+    return render_template(get_template_path('search.html'), query=query, results=results, page=page, has_next=has_next)
+
+@app.route('/api/search')
+def api_search():
+    query, results, page, has_next = get_search_page()
+    return jsonify({
+        'query': query,
+        'page': page,
+        'results': [{
+            'id': r['post'].id,
+            'title_html': str(r['title_html']),
+            'snippet_html': str(r['snippet_html']),
+            'url': url_for('post', post_id=r['post'].id),
+            'created_at': r['post'].created_at.isoformat(),
+            'category': r['post'].category.name if r['post'].category else None,
+        } for r in results],
+        'next_url': url_for('api_search', q=query, page=page + 1) if has_next else None,
+    })
+
+# Gallery image helpers
+@app.template_global()
+def photo_srcset(photo, ext):
+    return ', '.join(
+        f"{url_for('static', filename='uploads/photos/' + images.variant_filename(photo.filename, w, ext))} {w}w"
+        for w in photo.get_variant_widths()
+    )
+
+@app.template_global()
+def photo_src(photo):
+    """Fallback src: a mid-size variant when available, otherwise the original."""
+    widths = photo.get_variant_widths()
+    if not widths:
+        return url_for('static', filename='uploads/photos/' + photo.filename)
+    width = max([w for w in widths if w <= 960] or [widths[0]])
+    return url_for('static', filename='uploads/photos/' + images.variant_filename(photo.filename, width, 'jpg'))
+
+def get_photo_page():
+    return keyset_page(Photo.query, Photo, request.args.get('cursor'), app.config['PHOTOS_PER_PAGE'])
+
 @app.route('/gallery')
 def gallery():
-    photos = Photo.query.order_by(Photo.created_at.desc()).all()
-    return render_template(get_template_path('gallery.html'), photos=photos)
+    photos, next_cursor = get_photo_page()
+    return render_template(get_template_path('gallery.html'), photos=photos, next_cursor=next_cursor)
+
+@app.route('/api/photos')
+def api_photos():
+    """
+    JSON feed of the next batch of gallery photos in the current language, plus the
+    rendered cards for the current theme (same contract as /api/posts).
+    """
+    photos, next_cursor = get_photo_page()
+    lang = session.get('lang', 'zh')
+    items = []
+    for photo in photos:
+        items.append({
+            'id': photo.id,
+            'title': photo.title_en if lang == 'en' and photo.title_en else photo.title,
+            'description': photo.description_en if lang == 'en' and photo.description_en else photo.description,
+            'src': photo_src(photo),
+            'srcset': photo_srcset(photo, 'jpg'),
+            'srcset_webp': photo_srcset(photo, 'webp'),
+            'full': url_for('static', filename='uploads/photos/' + photo.filename),
+            'width': photo.width,
+            'height': photo.height,
+            'created_at': photo.created_at.isoformat(),
+        })
+    return jsonify({
+        'photos': items,
+        'html': render_template(get_template_path('_photo_cards.html'), photos=photos),
+        'next_cursor': next_cursor,
+        'next_url': url_for('api_photos', cursor=next_cursor) if next_cursor else None,
+    })
+
+# Feeds and sitemap
+# Feed readers and crawlers poll far more often than anything is written. Each document is
+# rendered once per content version (and host, as it holds absolute URLs) and then served
+# with an ETag and Last-Modified, so a repeat poll is a 304 that never touches the database.
+FEED_LANGS = ('zh', 'en')
+feed_cache = PageCache(32, 16 * 1024 * 1024)
+
+def cached_document(kind, lang, mimetype, render):
+    version = content_version.get()
+    key = (kind, lang, request.host_url)
+    entry = feed_cache.get(key, version)
+    if entry is None:
+        entry = feed_cache.put(key, version, render().encode('utf-8'), mimetype)
+    return conditional_page(Response(entry.body, mimetype=entry.mimetype), entry, per_reader=False)
+
+def as_utc(value):
+    return value.replace(tzinfo=timezone.utc) if value else datetime.now(timezone.utc)
+
+@app.template_filter('rfc822')
+def rfc822_filter(value):
+    return format_datetime(as_utc(value))
+
+@app.template_filter('rfc3339')
+def rfc3339_filter(value):
+    return as_utc(value).isoformat(timespec='seconds')
+
+def feed_entries(lang):
+    """The newest posts for a feed, with title and summary in `lang` where there is a translation."""
+    posts = Post.query.options(load_only(
+        Post.title, Post.title_en, Post.summary_zh, Post.summary_en, Post.excerpt, Post.excerpt_en,
+        Post.created_at, Post.custom_author, Post.author_id, Post.category_id
+    ), *post_relations()).order_by(Post.created_at.desc(), Post.id.desc()).limit(app.config['FEED_ENTRIES']).all()
+    entries = []
+    for post in posts:
+        if lang == 'en':
+            title = post.title_en or post.title
+            summary = post.summary_en or post.excerpt_en or post.excerpt
+        else:
+            title = post.title
+            summary = post.summary_zh or post.excerpt
+        entries.append({
+            'title': title,
+            'summary': summary or '',
+            'url': url_for('post', post_id=post.id, _external=True),
+            'published': post.created_at,
+            'author': post.custom_author or post.author.username,
+            'category': post.category.name if post.category else None,
+        })
+    return entries
+
+def render_feed(template, lang):
+    # Posts have no edit time; the content version is the time of the last write
+    version = content_version.get()
+    updated = datetime.fromtimestamp(version / 1e9, timezone.utc) if version else None
+    return render_template(template, lang=lang, entries=feed_entries(lang), updated=updated)
+
+@app.route('/feed/<lang>.atom')
+def atom_feed(lang):
+    if lang not in FEED_LANGS:
+        abort(404)
+    return cached_document('atom', lang, 'application/atom+xml', lambda: render_feed('feeds/atom.xml', lang))
+
+@app.route('/feed/<lang>.rss')
+def rss_feed(lang):
+    if lang not in FEED_LANGS:
+        abort(404)
+    return cached_document('rss', lang, 'application/rss+xml', lambda: render_feed('feeds/rss.xml', lang))
+
+@app.route('/sitemap.xml')
+def sitemap():
+    def render():
+        posts = db.session.query(Post.id, Post.created_at).order_by(Post.created_at.desc(), Post.id.desc()).all()
+        latest_photo = db.session.query(db.func.max(Photo.created_at)).scalar()
+        categories = [c.id for c in chrome_cache.get()['categories']]
+        return render_template('feeds/sitemap.xml', posts=posts, categories=categories,
+                               latest_post=posts[0].created_at if posts else None, latest_photo=latest_photo)
+    return cached_document('sitemap', None, 'application/xml', render)
 
 @app.route('/send-code', methods=['POST'])
 def send_code():
@@ -540,6 +1169,7 @@ def create_post():
         
         # Handle new category creation
         new_category_name = request.form.get('new_category')
+        new_category = False
         if new_category_name:
             existing_cat = Category.query.filter_by(name=new_category_name).first()
             if not existing_cat:
@@ -547,6 +1177,7 @@ def create_post():
                 db.session.add(new_cat)
                 db.session.commit()
                 category_id = new_cat.id
+                new_category = True
             else:
                 category_id = existing_cat.id
 
@@ -570,11 +1201,19 @@ def create_post():
             created_at=created_at,
             category_id=category_id if category_id else None
         )
+        new_post.refresh_excerpts()
+        render_post_html(new_post)
         db.session.add(new_post)
+        search.index_post(new_post)
         db.session.commit()
+        content_version.bump()
         
-        # Start background task for AI processing
-        threading.Thread(target=async_process_post, args=(app, new_post.id)).start()
+        # Queue background task for AI processing
+        job_queue.enqueue('process_post', new_post.id)
+        if new_category: # Its menu entry is on every page
+            queue_export('export_site')
+        else:
+            queue_export('export_post', new_post.id)
         
         flash('Post published. AI translation and summary generation running in background.')
         return redirect(url_for('index'))
@@ -587,6 +1226,7 @@ def create_post():
 def edit_post(post_id):
     post = Post.query.get_or_404(post_id)
     if request.method == 'POST':
+        old_category_id = post.category_id
         post.title = request.form.get('title')
         post.content = request.form.get('content')
         post.custom_author = request.form.get('custom_author')
@@ -598,12 +1238,22 @@ def edit_post(post_id):
             except ValueError:
                 pass # Keep original if invalid
         
-        # Re-translate on edit (Simplification: always re-translate)
-        # Clear existing AI content to trigger re-generation
+        # Re-translate on edit: clear existing AI content to trigger re-generation.
+        # The body is translated per block and unchanged blocks come from the cache,
+        # so fixing a typo only sends the edited section to the API.
         post.title_en = None
         post.content_en = None
         post.summary_zh = None
         post.summary_en = None
+        # Results of a job still working on the old text are discarded. Incremented in SQL,
+        # like the revision check in save_if_current()
+        post.revision = Post.revision + 1
+        post.refresh_excerpts()
+        render_post_html(post)
+        # Written even if they were already empty: an AI result for the old revision may
+        # have been saved since the post was loaded, and must not outlive the edit
+        for field in AI_POST_FIELDS:
+            flag_modified(post, field)
         
         # post.title_en = translate_text(post.title)
         # post.content_en = translate_text(post.content)
@@ -614,6 +1264,7 @@ def edit_post(post_id):
         
         category_id = request.form.get('category_id')
         new_category_name = request.form.get('new_category')
+        new_category = False
         if new_category_name:
             existing_cat = Category.query.filter_by(name=new_category_name).first()
             if not existing_cat:
@@ -621,14 +1272,23 @@ def edit_post(post_id):
                 db.session.add(new_cat)
                 db.session.commit()
                 category_id = new_cat.id
+                new_category = True
             else:
                 category_id = existing_cat.id
         
         post.category_id = category_id if category_id else None
+        search.index_post(post)
         db.session.commit()
+        content_version.bump()
         
-        # Start background task for AI processing
-        threading.Thread(target=async_process_post, args=(app, post.id)).start()
+        # Queue background task for AI processing
+        job_queue.enqueue('process_post', post.id)
+        if new_category: # Its menu entry is on every page
+            queue_export('export_site')
+        else:
+            queue_export('export_post', post.id)
+            if old_category_id and old_category_id != post.category_id: # The listing it left
+                queue_export('export_category', old_category_id)
         
         flash('Post updated. AI translation and summary generation running in background.')
         return redirect(url_for('post', post_id=post.id))
@@ -640,10 +1300,26 @@ def edit_post(post_id):
 @login_required
 def delete_post(post_id):
     post = Post.query.get_or_404(post_id)
+    category_id = post.category_id
+    search.remove_post(post.id)
     db.session.delete(post)
     db.session.commit()
+    content_version.bump()
+    queue_export('export_post', post_id)
+    if category_id:
+        queue_export('export_category', category_id)
     return redirect(url_for('index'))
 
+@app.route('/admin/profiles')
+@login_required
+def profiles():
+    return render_template(get_template_path('profiles.html'), profiles=profiling.list_profiles(app.config['PROFILE_DIR']))
+
+@app.route('/admin/profiles/<name>')
+@login_required
+def download_profile(name):
+    return send_from_directory(app.config['PROFILE_DIR'], name, as_attachment=True)
+
 @app.route('/settings', methods=['GET', 'POST'])
 @login_required
 def settings():
@@ -657,6 +1333,7 @@ def settings():
         site_settings.blog_name = request.form.get('blog_name')
         site_settings.about_content = request.form.get('about_content')
         site_settings.notification_content = request.form.get('notification_content')
+        render_about_html(site_settings)
         
         # Update DeepSeek API Key
         new_key = request.form.get('deepseek_api_key')
@@ -693,9 +1370,11 @@ def settings():
                 site_settings.logo_filename = filename
         
         db.session.commit()
+        content_version.bump()
 
-        # Start background task for AI processing (About Content Translation)
-        threading.Thread(target=async_process_settings, args=(app,)).start()
+        # Queue background task for AI processing (About Content Translation)
+        job_queue.enqueue('process_settings')
+        queue_export('export_site')
 
         flash('Settings updated. AI translation for About Me is running in background.')
         return redirect(url_for('settings'))
@@ -707,14 +1386,14 @@ def upload_photo():
     if 'photo' in request.files:
         file = request.files['photo']
         if file and file.filename:
-            # Generate unique filename using UUID
-            ext = os.path.splitext(file.filename)[1]
-            filename = f"{uuid.uuid4().hex}{ext}"
-            
-            save_path = os.path.join(app.config['UPLOAD_FOLDER'], 'photos')
-            if not os.path.exists(save_path):
-                os.makedirs(save_path)
-            file.save(os.path.join(save_path, filename))
+            ext = images.stored_suffix(file.filename)
+            if not ext:
+                flash('Only JPEG, PNG, GIF and WebP images can be uploaded.')
+                return redirect(url_for('gallery'))
+            # Stored under the hash of its content, so re-uploads share one file
+            filename = photo_store.store(file, os.path.join(app.config['UPLOAD_FOLDER'], 'photos'), ext)
+            # Variants of a file already in the gallery exist too
+            twin = Photo.query.filter(Photo.filename == filename, Photo.variant_widths.isnot(None)).first()
             
             title = request.form.get('title')
             description = request.form.get('description')
@@ -730,11 +1409,17 @@ def upload_photo():
                 description=description,
                 # description_en=description_en
             )
+            if twin:
+                new_photo.width, new_photo.height, new_photo.variant_widths = twin.width, twin.height, twin.variant_widths
             db.session.add(new_photo)
             db.session.commit()
+            content_version.bump()
 
-            # Start background task for AI processing
-            threading.Thread(target=async_process_photo, args=(app, new_photo.id)).start()
+            # Queue background tasks for AI processing and resized copies
+            job_queue.enqueue('process_photo', new_photo.id)
+            if not twin:
+                job_queue.enqueue('photo_variants', new_photo.id)
+            queue_export('export_gallery')
 
             flash('Photo uploaded successfully. AI translation running in background.')
     return redirect(url_for('gallery'))
@@ -743,19 +1428,24 @@ def upload_photo():
 @login_required
 def delete_photo(photo_id):
     photo = Photo.query.get_or_404(photo_id)
-    # Optionally remove file from disk
-    try:
-        os.remove(os.path.join(app.config['UPLOAD_FOLDER'], 'photos', photo.filename))
-    except:
-        pass
+    filename, widths = photo.filename, photo.get_variant_widths()
     db.session.delete(photo)
     db.session.commit()
+    content_version.bump()
+    # Files are shared by photos with the same content: remove them with the last one
+    if not Photo.query.filter_by(filename=filename).count():
+        photos_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'photos')
+        photo_store.remove(os.path.join(photos_dir, filename))
+        images.remove_variants(photos_dir, filename, widths)
+    queue_export('export_gallery')
     return redirect(url_for('gallery'))
 
 # Init DB command
 def init_db():
     with app.app_context():
         db.create_all()
+        upgrade_schema()
+        search.ensure_index()
         # We still create a default admin user for the ID=1 reference
         if not User.query.filter_by(username='admin').first():
             admin = User(username='admin', password=generate_password_hash('admin123'))
@@ -773,8 +1463,139 @@ def init_db():
             print("Initialized default category.")
             
         db.session.commit()
+        content_version.bump()
+
+def backfill_excerpts():
+    """Fills listing excerpts for posts written before the excerpt columns existed."""
+    posts = Post.query.filter(Post.excerpt.is_(None)).all()
+    for post in posts:
+        post.refresh_excerpts()
+    if posts:
+        db.session.commit()
+        print(f"Backfilled excerpts for {len(posts)} posts.")
+
+@app.cli.command('render-html')
+def render_html_command():
+    """(Re)render stored HTML for posts and the about page that predate RENDERER_VERSION."""
+    stale = or_(Post.html_version.is_(None), Post.html_version != RENDERER_VERSION)
+    count = 0
+    while True:
+        # Small batches keep memory flat on large archives
+        posts = Post.query.filter(stale).limit(100).all()
+        if not posts:
+            break
+        for post in posts:
+            render_post_html(post)
+        db.session.commit()
+        count += len(posts)
+    settings = SiteSetting.query.first()
+    if settings:
+        render_about_html(settings)
+        db.session.commit()
+    print(f"Rendered HTML for {count} posts and the about page.")
+
+@app.cli.command('build-variants')
+@click.option('--all', 'rebuild_all', is_flag=True, help='Rebuild photos that already have variants.')
+def build_variants_command(rebuild_all):
+    """Generate resized gallery copies for photos uploaded before the image pipeline."""
+    query = Photo.query if rebuild_all else Photo.query.filter(Photo.variant_widths.is_(None))
+    count = 0
+    for photo in query.all():
+        if build_photo_variants(photo):
+            db.session.commit()
+            count += 1
+    content_version.bump()
+    print(f"Built variants for {count} photos.")
+
+@app.cli.command('dedupe-photos')
+@click.option('--dry-run', is_flag=True, help='Only report what would change.')
+def dedupe_photos_command(dry_run):
+    """Rename uploaded photos to their content hash and delete duplicate copies."""
+    photos_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'photos')
+    photos = Photo.query.order_by(Photo.id).all()
+    renames = {} # old filename -> content-addressed filename
+    widths = {} # old filename -> variant widths built for it
+    sizes = {} # old filename -> bytes
+    for photo in photos:
+        if photo.filename not in renames:
+            path = os.path.join(photos_dir, photo.filename)
+            if not os.path.exists(path):
+                print(f"Photo {photo.id}: {photo.filename} is missing, skipped.")
+                renames[photo.filename] = photo.filename
+                continue
+            ext = images.stored_suffix(photo.filename)
+            if not ext:
+                print(f"Photo {photo.id}: {photo.filename} is not a JPEG, PNG, GIF or WebP image, skipped.")
+                renames[photo.filename] = photo.filename
+                continue
+            renames[photo.filename] = photo_store.hash_file(path) + ext
+            sizes[photo.filename] = os.path.getsize(path)
+        widths.setdefault(photo.filename, set()).update(photo.get_variant_widths())
+    moved = {old: new for old, new in renames.items() if old != new}
+    before = sum(sizes.values())
+    after = sum({renames[old]: size for old, size in sizes.items()}.values())
+    print(f"{len(renames)} files, {len(moved)} to rename, {len(set(renames.values()))} after deduplication, "
+          f"{(before - after) / 1e6:.1f} MB of originals {'to free' if dry_run else 'freed'}.")
+    if dry_run or not moved:
+        return
+
+    # Link the new names first and delete the old ones after the commit, so every row
+    # points at an existing file at any moment, and an interrupted run can be repeated
+    for old, new in moved.items():
+        _link(os.path.join(photos_dir, old), os.path.join(photos_dir, new))
+        for w in widths[old]:
+            for ext in ('jpg', 'webp'):
+                old_variant = os.path.join(photos_dir, images.variant_filename(old, w, ext))
+                if os.path.exists(old_variant):
+                    _link(old_variant, os.path.join(photos_dir, images.variant_filename(new, w, ext)))
+    built = {} # new filename -> a photo with variants, whose size and widths duplicates share
+    for photo in photos:
+        photo.filename = renames[photo.filename]
+        if photo.variant_widths:
+            built.setdefault(photo.filename, photo)
+    for photo in photos:
+        twin = built.get(photo.filename)
+        if twin and not photo.variant_widths:
+            photo.width, photo.height, photo.variant_widths = twin.width, twin.height, twin.variant_widths
+    db.session.commit()
+    content_version.bump()
+    for old, new in moved.items():
+        if old.lower() != new.lower(): # Same file on case-insensitive filesystems
+            photo_store.remove(os.path.join(photos_dir, old))
+            images.remove_variants(photos_dir, old, widths[old])
+    queue_export('export_gallery')
+    print(f"Renamed {len(moved)} files.")
+
+def _link(source, target):
+    """Gives `source` the name `target` too, unless a file with that name (and content) exists."""
+    if not os.path.exists(target):
+        os.link(source, target)
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create missing tables/columns/indexes and default rows."""
+    init_db()
+
+def create_app():
+    """
+    Returns the app ready to serve. Importing this module only defines the app; this
+    brings the database up to date with the models (new columns, indexes, search tables)
+    and loads the Markdown/Pygments stack that the first render would otherwise pay for.
+
+    Serve it with `gunicorn -c gunicorn.conf.py 'app:create_app()'`. With --preload it runs
+    once in the master, and the forked workers share the loaded modules.
+    """
+    with app.app_context():
+        db.create_all()
+        upgrade_schema()
+        backfill_excerpts()
+        search.ensure_index()
+        # Workers must not inherit the master's SQLite connection; each opens its own
+        db.engine.dispose()
+    render_markdown("```python\nprint('warm-up')\n```") # Imports markdown, codehilite and the Pygments lexer/formatter
+    metrics.start()
+    return app
 
 if __name__ == '__main__':
-    if not os.path.exists('blog.db'):
-        init_db()
-    app.run(debug=True, host='0.0.0.0', port=15013)
+    init_db()
+    create_app().run(debug=True, host='0.0.0.0', port=15013)
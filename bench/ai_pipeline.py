@@ -0,0 +1,65 @@
+"""
+Wall-clock time for a post's AI processing (title + content translation and the
+two summaries) against the local DeepSeek stub with simulated latency.
+
+Compares AI_POOL_SIZE=1 (the calls one after another) with the configured pool,
+each in a fresh process with its own temporary database.
+
+    python bench/ai_pipeline.py --latency 0.5 --posts 5
+"""
+from gevent import monkey
+monkey.patch_all() # As the app runs in production (gunicorn.conf.py)
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import time
+
+def run_child(args):
+    from seed import use_temp_database, make_markdown
+    from deepseek_stub import StubServer
+
+    server = StubServer(latency=args.latency)
+    use_temp_database()
+    os.environ['DEEPSEEK_BASE_URL'] = server.base_url
+    os.environ['JOB_WORKERS'] = '0' # Run the jobs here, in the foreground
+
+    from app import app, init_db, async_process_post
+    from models import db, Post, User
+
+    server.start()
+    init_db()
+    rng = random.Random(0)
+    with app.app_context():
+        author = User.query.first()
+        posts = [Post(title=f"标题 {i}", content=make_markdown(rng, 6), author=author) for i in range(args.posts)]
+        db.session.add_all(posts)
+        db.session.commit()
+        ids = [p.id for p in posts]
+
+    timings = []
+    for post_id in ids:
+        start = time.perf_counter()
+        async_process_post(app, post_id)
+        timings.append(time.perf_counter() - start)
+    print(f"AI_POOL_SIZE={app.config['AI_POOL_SIZE']:<3} mean per post={sum(timings) / len(timings):6.2f}s  "
+          f"api requests={server.stats['requests']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--latency', type=float, default=0.5, help='Simulated API latency in seconds.')
+    parser.add_argument('--posts', type=int, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args)
+        return
+    for pool_size in ('1', os.environ.get('AI_POOL_SIZE', '8')):
+        env = dict(os.environ, AI_POOL_SIZE=pool_size)
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--child', '--latency', str(args.latency), '--posts', str(args.posts)],
+                       env=env, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+if __name__ == '__main__':
+    main()
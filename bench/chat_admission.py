@@ -0,0 +1,85 @@
+"""
+/api/chat under a burst of visitors, a single scripted client and a repeated
+opening question, against the local DeepSeek stub with simulated latency.
+
+Serves the app with gevent's WSGI server in this process (as gunicorn -k gevent
+would) and reports status codes and response times for each scenario.
+
+    python bench/chat_admission.py --latency 2 --burst 40
+"""
+from gevent import monkey
+monkey.patch_all() # As the app runs in production (gunicorn.conf.py)
+
+import argparse
+import os
+import statistics
+import time
+
+from seed import use_temp_database, seed_database
+from deepseek_stub import StubServer
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--latency', type=float, default=2.0, help='Simulated time to first token, in seconds.')
+    parser.add_argument('--burst', type=int, default=40, help='Visitors asking at the same moment.')
+    parser.add_argument('--max-concurrent', default='8')
+    parser.add_argument('--queue-timeout', default='0.5')
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.latency, reply='This blog is about databases, caching and travel photos. ' * 8)
+    use_temp_database()
+    os.environ.update({
+        'DEEPSEEK_BASE_URL': server.base_url,
+        'JOB_WORKERS': '0',
+        'PROXY_COUNT': '1', # Each simulated visitor gets its own X-Forwarded-For address
+        'CHAT_MAX_CONCURRENT': args.max_concurrent,
+        'CHAT_QUEUE_TIMEOUT': args.queue_timeout,
+    })
+    from app import app
+    import gevent
+    from gevent.pywsgi import WSGIServer
+    import requests
+
+    server.start()
+    seed_database(app, posts=200, photos=0)
+    http = WSGIServer(('127.0.0.1', 0), app, log=None)
+    http.start()
+    url = f"http://127.0.0.1:{http.server_port}/api/chat"
+
+    def ask(message, ip, history=()):
+        start = time.perf_counter()
+        response = requests.post(url, json={'message': message, 'history': list(history)},
+                                 headers={'X-Forwarded-For': ip})
+        return response.status_code, time.perf_counter() - start
+
+    def report(label, results):
+        by_status = {}
+        for status, elapsed in results:
+            by_status.setdefault(status, []).append(elapsed * 1000)
+        summary = '  '.join(f"{status}: {len(times):>3} (median {statistics.median(times):7.1f}ms)"
+                            for status, times in sorted(by_status.items()))
+        print(f"{label:<34} {summary}")
+
+    print(f"limits: {app.config['CHAT_MAX_CONCURRENT']} concurrent, {app.config['CHAT_QUEUE_TIMEOUT']}s queue, "
+          f"{app.config['CHAT_BURST']} burst + {app.config['CHAT_RATE_PER_MINUTE']:g}/min per client; stub latency {args.latency}s")
+
+    # Many visitors at once, each with a different follow-up question (no answer cache)
+    history = [{'role': 'user', 'content': 'hi'}, {'role': 'assistant', 'content': 'hello'}]
+    jobs = [gevent.spawn(ask, f"question {i} about caching", f"10.0.{i // 250}.{i % 250}", history) for i in range(args.burst)]
+    gevent.joinall(jobs)
+    report(f"burst of {args.burst} visitors", [job.value for job in jobs])
+
+    # One client asking as fast as it can
+    results = [ask(f"scripted question {i}", '10.9.9.9', history) for i in range(15)]
+    report('one client, 15 questions in a row', results)
+
+    # The same opening question from different visitors
+    before = server.stats['requests']
+    results = [ask(question, f"10.8.0.{i}") for i, question in enumerate(
+        ['What is this blog about?', 'what is this blog about', 'What  is this blog about？', 'WHAT IS THIS BLOG ABOUT!'])]
+    report('same first question x4', results)
+    print(f"{'':<34} upstream requests: {server.stats['requests'] - before}")
+    http.stop()
+
+if __name__ == '__main__':
+    main()
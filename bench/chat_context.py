@@ -0,0 +1,61 @@
+"""
+Size and build time of the /api/chat system context.
+
+Seeds a synthetic blog and, for a few questions, compares the old context (the
+10 newest posts with their summaries, whatever the question) with retrieval of
+the most relevant chunks from the search index, and fails if retrieval ever
+gives the larger prompt.
+
+    python bench/chat_context.py --posts 2000
+"""
+import argparse
+import os
+import statistics
+import time
+
+from seed import use_temp_database, seed_database
+
+QUESTIONS = ['缓存和数据库性能', '有没有关于旅行照片的文章？', 'server network design', '代码 learning notes']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    use_temp_database()
+    os.environ['JOB_WORKERS'] = '0'
+    from app import app, get_blog_context
+    from models import Post, SiteSetting
+    import search
+
+    seed_database(app, posts=args.posts, photos=0, paragraphs=12)
+
+    def newest_posts_context():
+        # What get_blog_context built before retrieval
+        settings = SiteSetting.query.first()
+        parts = [f"Blog Name: {settings.blog_name}", f"About Content: {settings.about_content}", "\nRecent Articles:"]
+        for post in Post.query.order_by(Post.created_at.desc()).limit(10).all():
+            summary = post.summary_zh if post.summary_zh else (post.content[:200] + "...")
+            parts.append(f"- Title: {post.title}\n  URL: http://localhost/post/{post.id}\n  Summary: {summary}")
+        return "\n\n".join(parts)
+
+    with app.test_request_context('/'):
+        old_tokens = search.estimate_tokens(newest_posts_context())
+        largest = 0
+        for question in QUESTIONS:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                context = get_blog_context(question)
+                timings.append((time.perf_counter() - start) * 1000)
+            largest = max(largest, search.estimate_tokens(context))
+            chunks = search.retrieve(question)
+            posts = len({c['post_id'] for c in chunks})
+            print(f"{question:<24} tokens={search.estimate_tokens(context):>5}  chunks={len(chunks)} from {posts} posts  "
+                  f"build={statistics.median(timings):6.2f}ms")
+        print(f"{'(newest 10 posts)':<24} tokens={old_tokens:>5}  same for every question")
+    assert largest <= old_tokens, f"Retrieval context ({largest} tokens) is larger than the old one ({old_tokens})"
+
+if __name__ == '__main__':
+    main()
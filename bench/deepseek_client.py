@@ -0,0 +1,66 @@
+"""
+Per-call cost of a fresh OpenAI client versus the shared, pooled DeepSeekClient.
+
+Runs the same small completion against the local stub server both ways and
+reports latency and the number of TCP connections opened. Against the real API
+each extra connection also costs a TLS handshake, so the savings there are
+larger than shown here.
+
+    python bench/deepseek_client.py --calls 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from openai import OpenAI  # noqa: E402
+from deepseek import DeepSeekClient  # noqa: E402
+from deepseek_stub import StubServer  # noqa: E402
+
+MESSAGES = [
+    {"role": "system", "content": "You are a professional translator."},
+    {"role": "user", "content": "你好，世界"},
+]
+
+def run(server, label, call, calls):
+    before = dict(server.stats)
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f"{label:<16} mean={statistics.mean(timings):7.2f}ms  p50={timings[len(timings) // 2]:7.2f}ms  "
+          f"p95={timings[int(len(timings) * 0.95) - 1]:7.2f}ms  "
+          f"connections={server.stats['connections'] - before['connections']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0, help='Simulated API latency in seconds.')
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.latency).start()
+
+    def per_call():
+        # What translate_text/generate_summary/chat_api used to do
+        client = OpenAI(api_key='stub', base_url=server.base_url)
+        client.chat.completions.create(model='deepseek-chat', messages=MESSAGES)
+
+    shared = DeepSeekClient(server.base_url, lambda: 'stub')
+
+    def pooled():
+        shared.chat(MESSAGES)
+
+    # One warm-up call each so imports and first-use setup are not measured
+    per_call()
+    pooled()
+    run(server, 'client per call', per_call, args.calls)
+    run(server, 'shared client', pooled, args.calls)
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Local stand-in for the DeepSeek (OpenAI-compatible) chat completions API.
+
+Answers POST /chat/completions, streaming or not, after an optional delay, and
+counts the TCP connections it accepts so benchmarks can see connection reuse,
+and the completions it sent in full (GET /stats returns the counts).
+The reply echoes the last user message, which keeps "translations" the same
+shape as their input.
+
+    python bench/deepseek_stub.py --port 18080 --latency 0.2
+    DEEPSEEK_BASE_URL=http://127.0.0.1:18080 gunicorn ...
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, like the real API
+    disable_nagle_algorithm = True # Headers and body go out in separate writes
+
+    def setup(self):
+        super().setup()
+        with self.server.stats_lock:
+            self.server.stats['connections'] += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/stats':
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+        with self.server.stats_lock:
+            stats = dict(self.server.stats)
+        self._send_json(200, stats)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            payload = {}
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+        with self.server.stats_lock:
+            self.server.stats['requests'] += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        messages = payload.get('messages') or [{}]
+        text = next((m.get('content') or '' for m in reversed(messages) if m.get('role') == 'user'), '')
+        reply = self.server.reply if self.server.reply is not None else text
+        model = payload.get('model', 'deepseek-chat')
+        usage = {'prompt_tokens': sum(len(m.get('content') or '') for m in messages) // 4, 'completion_tokens': len(reply) // 4}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        if payload.get('stream'):
+            self._send_stream(model, reply, usage)
+        else:
+            self._send_json(200, {
+                'id': 'chatcmpl-stub', 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+        with self.server.stats_lock:
+            self.server.stats['completions'] += 1
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, model, reply, usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        pieces = [reply[i:i + 16] for i in range(0, len(reply), 16)] or ['']
+        for i, piece in enumerate(pieces):
+            last = i == len(pieces) - 1
+            chunk = {
+                'id': 'chatcmpl-stub', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': 'stop' if last else None}],
+            }
+            if last:
+                chunk['usage'] = usage
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b'')
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, reply=None):
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.latency = latency
+        self.reply = reply
+        self.stats = {'connections': 0, 'requests': 0, 'completions': 0}
+        self.stats_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        """Serves from a daemon thread and returns self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before answering.')
+    parser.add_argument('--reply', default=None, help='Fixed reply text (default: echo the user message).')
+    args = parser.parse_args()
+    server = StubServer(args.port, args.latency, args.reply)
+    print(f"DeepSeek stub on {server.base_url} (latency {args.latency}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
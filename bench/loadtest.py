@@ -0,0 +1,221 @@
+"""
+Load test of the app as it runs in production: gunicorn with gevent workers
+(gunicorn.conf.py),
+against a seeded temporary database and the local DeepSeek stub.
+
+Each scenario (/, /post/<id>, /gallery, /about, streaming /api/chat) is driven
+by --concurrency clients in a closed loop for --duration seconds. Results
+(requests per second, p50/p95/p99 latency, and time to first byte for the
+chat stream) are written as JSON, so runs can be compared across commits:
+
+    python bench/loadtest.py --posts 2000 --workers 4 --output before.json
+    python bench/loadtest.py --posts 2000 --workers 4 --output after.json
+
+A summary table goes to stderr. Chat rate limiting is turned off unless
+--chat-rate-limit is given, so the test measures the app and not the limiter.
+A chat reply only counts as a success if it is not the app's streamed
+"Error: ..." message, and the run fails if the DeepSeek stub sent fewer
+completions than that.
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import gevent
+import requests
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+SCENARIOS = ['index', 'post', 'gallery', 'about', 'chat']
+CHAT_QUESTIONS = ['缓存和数据库性能', '有没有关于旅行照片的文章？', 'server network design', '代码 learning notes']
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def seed(args):
+    """Child mode: seed the database named by DATABASE_URL."""
+    sys.path.insert(0, BENCH)
+    from seed import seed_database
+    os.environ['JOB_WORKERS'] = '0'
+    from app import app
+    seed_database(app, posts=args.posts, photos=args.photos, categories=args.categories)
+
+def wait_until_up(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"gunicorn exited with code {process.returncode}")
+        try:
+            if requests.get(url, timeout=5).status_code == 200:
+                return
+        except requests.RequestException:
+            pass # Still booting
+        time.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout}s")
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))], 2)
+
+def run_scenario(name, base_url, args, stub_url=None):
+    rng = random.Random(name)
+    latencies, first_bytes = [], []
+    errors = 0
+    deadline = time.monotonic() + args.duration
+
+    def client(n):
+        nonlocal errors
+        session = requests.Session() # Keep-alive per client, like a browser
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                if name == 'chat':
+                    # Follow-up turn, so every request streams a fresh answer instead of a cached one
+                    response = session.post(f"{base_url}/api/chat", stream=True, headers={'X-Forwarded-For': f"10.1.{n // 250}.{n % 250}"},
+                                            json={'message': rng.choice(CHAT_QUESTIONS), 'history': [
+                                                {'role': 'user', 'content': 'hi'}, {'role': 'assistant', 'content': 'hello'}]})
+                    chunks = response.iter_content(chunk_size=None)
+                    first = next(chunks, b'')
+                    first_byte = time.perf_counter() - start
+                    for _ in chunks:
+                        pass
+                    if first.startswith(b'Error:'): # Failures are streamed with status 200
+                        errors += 1
+                        continue
+                else:
+                    path = {'index': '/', 'post': f"/post/{rng.randint(1, args.posts)}", 'gallery': '/gallery', 'about': '/about'}[name]
+                    response = session.get(base_url + path)
+                    response.content
+            except requests.RequestException:
+                errors += 1
+                continue
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                errors += 1
+                continue
+            latencies.append(elapsed * 1000)
+            if name == 'chat':
+                first_bytes.append(first_byte * 1000)
+
+    completions = requests.get(f"{stub_url}/stats").json()['completions'] if stub_url else None
+    started = time.perf_counter()
+    gevent.joinall([gevent.spawn(client, n) for n in range(args.concurrency)])
+    wall = time.perf_counter() - started
+    latencies.sort()
+    first_bytes.sort()
+    result = {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / wall, 1),
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': round(latencies[-1], 2) if latencies else None,
+    }
+    if name == 'chat':
+        result['upstream_completions'] = requests.get(f"{stub_url}/stats").json()['completions'] - completions
+        if result['upstream_completions'] < len(latencies):
+            raise SystemExit(f"chat: {len(latencies)} successful replies but only {result['upstream_completions']} completions from the stub")
+        result.update(ttfb_p50_ms=percentile(first_bytes, 0.50), ttfb_p95_ms=percentile(first_bytes, 0.95), ttfb_p99_ms=percentile(first_bytes, 0.99))
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--photos', type=int, default=200)
+    parser.add_argument('--categories', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes.')
+    parser.add_argument('--concurrency', type=int, default=20, help='Clients per scenario.')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per scenario.')
+    parser.add_argument('--latency', type=float, default=0.5, help='Simulated DeepSeek latency in seconds.')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated subset of: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--no-page-cache', action='store_true', help='Render every page (PAGE_CACHE_MAX_ENTRIES=0).')
+    parser.add_argument('--chat-rate-limit', action='store_true', help='Keep the per-client chat rate limit.')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout.')
+    parser.add_argument('--seed', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.seed:
+        seed(args)
+        return
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    sys.path.insert(0, BENCH)
+    from seed import use_temp_database
+    database = use_temp_database()
+    env = dict(os.environ, JOB_WORKERS='0', PROXY_COUNT='1')
+    if args.no_page_cache:
+        env['PAGE_CACHE_MAX_ENTRIES'] = '0'
+    if not args.chat_rate_limit:
+        env['CHAT_RATE_PER_MINUTE'] = '0'
+
+    print(f"Seeding {args.posts} posts, {args.photos} photos, {args.categories} categories...", file=sys.stderr)
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--seed', '--posts', str(args.posts), '--photos', str(args.photos),
+                    '--categories', str(args.categories)], env=env, check=True, stdout=subprocess.DEVNULL)
+
+    processes = []
+    try:
+        stub_port = free_port()
+        processes.append(subprocess.Popen([sys.executable, os.path.join(BENCH, 'deepseek_stub.py'), '--port', str(stub_port),
+                                           '--latency', str(args.latency)], stdout=subprocess.DEVNULL))
+        env['DEEPSEEK_BASE_URL'] = f"http://127.0.0.1:{stub_port}"
+        port = free_port()
+        gunicorn = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-w', str(args.workers),
+                                     '-b', f"127.0.0.1:{port}", '--log-level', 'warning', 'app:create_app()'], cwd=ROOT, env=env)
+        processes.append(gunicorn)
+        base_url = f"http://127.0.0.1:{port}"
+        wait_until_up(base_url + '/', gunicorn)
+
+        results = {}
+        for name in scenarios:
+            stub_url = f"http://127.0.0.1:{stub_port}" if name == 'chat' else None
+            run_scenario(name, base_url, argparse.Namespace(**dict(vars(args), duration=min(2.0, args.duration))), stub_url) # Warm-up
+            results[name] = run_scenario(name, base_url, args, stub_url)
+            r = results[name]
+            print(f"{name:<8} {r['rps']:>8.1f} req/s  p50={r['p50_ms']}ms  p95={r['p95_ms']}ms  p99={r['p99_ms']}ms  "
+                  f"errors={r['errors']}" + (f"  ttfb p50={r['ttfb_p50_ms']}ms" if name == 'chat' else ''), file=sys.stderr)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'config': {key: getattr(args, key) for key in ('posts', 'photos', 'categories', 'workers', 'concurrency', 'duration',
+                                                        'latency', 'no_page_cache', 'chat_rate_limit')},
+        'database': database,
+        'scenarios': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Query-count regression check for the reader pages.
+
+Seeds a throwaway database, requests each page as an anonymous reader and fails
+if a page runs more SQL statements than its budget, or if the count grows with
+the number of posts/photos (an N+1 sneaking back in).
+
+    python bench/query_budget.py
+"""
+import os
+import sys
+
+from seed import use_temp_database, seed_database
+
+use_temp_database()
+os.environ['PAGE_CACHE_MAX_ENTRIES'] = '0' # Measure the render path, not the page cache
+os.environ['JOB_WORKERS'] = '0' # Keep background polling out of the counts
+
+from sqlalchemy import event  # noqa: E402
+from app import app  # noqa: E402
+from models import db  # noqa: E402
+
+# Statements per request for a reader with a fresh session, once the site chrome
+# (settings, categories) is cached
+BUDGETS = {
+    '/': 1,
+    '/?category=1': 2,
+    '/api/posts': 1,
+    '/post/1': 1,
+    '/gallery': 1,
+    '/search?q=%E5%8D%9A%E5%AE%A2': 3, # 博客: match count, ranked ids, the page of posts
+}
+
+def count_queries(client, url):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 200, f"{url} returned {response.status_code}"
+    return statements
+
+def main():
+    failures = []
+    counts = {}
+    # Two corpus sizes: the second seeding adds rows, so any per-row query shows up as growth
+    for round_no, (posts, photos) in enumerate([(5, 5), (40, 40)]):
+        seed_database(app, posts=posts, photos=photos, categories=4, authors=4, seed=round_no)
+        client = app.test_client()
+        for url, budget in BUDGETS.items():
+            client.get(url) # Warm the per-process caches
+            statements = count_queries(client, url)
+            counts.setdefault(url, []).append(len(statements))
+            if len(statements) > budget:
+                failures.append(f"{url}: {len(statements)} queries (budget {budget})\n    " + '\n    '.join(statements))
+
+    for url, seen in counts.items():
+        print(f"{url:<30} queries={seen}  budget={BUDGETS[url]}")
+        if len(set(seen)) > 1:
+            failures.append(f"{url}: query count depends on data size {seen}")
+
+    if failures:
+        print('\nFAILED:\n' + '\n'.join(failures))
+        return 1
+    print('\nAll pages within budget.')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Full-text search latency on a synthetic 10k-post corpus.
+
+Posts are written from a Zipf-distributed vocabulary of Chinese and English
+words, so queries range from very common to rare terms like on a real blog.
+Reports the FTS query alone and the full /api/search request (highlighting and
+snippets included) per query class.
+
+    python bench/search_latency.py --posts 10000
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from seed import use_temp_database
+
+# Frequent Chinese characters to build two/three-character words from
+CHARS = ('的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经'
+         '十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表'
+         '间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位'
+         '入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色')
+WORDS_EN = ['cache', 'database', 'index', 'query', 'server', 'network', 'python', 'flask', 'sqlite', 'gevent', 'deploy',
+            'latency', 'travel', 'photo', 'camera', 'design', 'kernel', 'memory', 'thread', 'socket']
+
+def make_vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        if rng.random() < 0.8:
+            words.add(''.join(rng.choice(CHARS) for _ in range(rng.choice((2, 2, 3)))))
+        else:
+            words.add(rng.choice(WORDS_EN) + rng.choice(['', 's', 'ing', 'ed']) + str(rng.randint(0, 99)))
+    return sorted(words)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--words', type=int, default=300, help='Words per post.')
+    parser.add_argument('--vocabulary', type=int, default=30000)
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    use_temp_database()
+    os.environ['JOB_WORKERS'] = '0'
+    os.environ['PAGE_CACHE_MAX_ENTRIES'] = '0' # Measure the search, not the page cache
+    from app import app, init_db
+    from models import db, Post, User
+    import search
+
+    init_db()
+    rng = random.Random(0)
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))] # Zipf
+
+    start = time.perf_counter()
+    with app.app_context():
+        author_id = User.query.first().id
+        created = datetime(2015, 1, 1)
+        for i in range(args.posts):
+            body = rng.choices(vocabulary, weights, k=args.words)
+            sentences = ['，'.join(body[j:j + 12]) + '。' for j in range(0, len(body), 12)]
+            db.session.add(Post(
+                title=''.join(rng.choices(vocabulary, weights, k=4)),
+                content='\n\n'.join(sentences),
+                created_at=created + timedelta(hours=i), author_id=author_id,
+            ))
+            if i % 1000 == 999:
+                db.session.commit()
+        db.session.commit()
+        search.reindex_all()
+        print(f"Seeded and indexed {args.posts} posts in {time.perf_counter() - start:.1f}s")
+
+        chinese = [w for w in vocabulary if search.CJK_RE.match(w)]
+        queries = {
+            'very common word': vocabulary[0],
+            'common word': vocabulary[20],
+            'mid-frequency word': vocabulary[500],
+            'rare word': vocabulary[20000],
+            'two common words': f"{vocabulary[1]} {vocabulary[3]}",
+            'common + rare': f"{vocabulary[2]} {vocabulary[15000]}",
+            'no match': 'zzzzqqq',
+            # One Chinese character: LIKE scan instead of the index (see search_posts)
+            'one character': chinese[500][0],
+            'one char + word': f"{chinese[500][0]} {vocabulary[20]}",
+        }
+        client = app.test_client()
+        print(f"{'query':<20} {'matches':>8} {'fts p50':>9} {'fts p95':>9} {'api p50':>9} {'api p95':>9}")
+        for label, q in queries.items():
+            if any(len(w) == 1 and search.CJK_RE.match(w) for w in q.split()):
+                matches = Post.query.filter(*(db.or_(Post.title.like(f'%{w}%'), Post.content.like(f'%{w}%')) for w in q.split())).count()
+            else:
+                matches = db.session.execute(db.text("SELECT count(*) FROM post_fts WHERE post_fts MATCH :q"),
+                                             {'q': search.search_query(q)}).scalar()
+            fts, api = [], []
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                search.search_posts(q, 1, app.config['POSTS_PER_PAGE'])
+                fts.append((time.perf_counter() - t) * 1000)
+                t = time.perf_counter()
+                client.get('/api/search', query_string={'q': q})
+                api.append((time.perf_counter() - t) * 1000)
+            fts.sort()
+            api.sort()
+            p95 = int(args.repeat * 0.95) - 1
+            print(f"{label:<20} {matches:>8} {statistics.median(fts):>7.2f}ms {fts[p95]:>7.2f}ms "
+                  f"{statistics.median(api):>7.2f}ms {api[p95]:>7.2f}ms")
+
+if __name__ == '__main__':
+    main()
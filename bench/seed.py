@@ -0,0 +1,85 @@
+"""
+Synthetic content shared by the scripts in bench/.
+
+Scripts call use_temp_database() *before* importing app, so they never touch the
+real blog.db, then seed_database(app, ...) to fill it.
+"""
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+WORDS_ZH = ['博客', '技术', '随笔', '数据库', '性能', '缓存', '翻译', '摘要', '照片', '旅行', '代码', '服务器', '网络', '设计', '学习']
+WORDS_EN = ['blog', 'tech', 'notes', 'database', 'performance', 'cache', 'translate', 'summary', 'photo', 'travel', 'code', 'server', 'network', 'design', 'learning']
+
+def use_temp_database():
+    """Points the app at a fresh SQLite file in a temp dir and returns its path."""
+    path = os.path.join(tempfile.mkdtemp(prefix='wslll_bench_'), 'blog.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    return path
+
+def make_markdown(rng, paragraphs):
+    parts = [f"# {rng.choice(WORDS_ZH)}{rng.choice(WORDS_ZH)}"]
+    for i in range(paragraphs):
+        parts.append(''.join(rng.choice(WORDS_ZH) for _ in range(rng.randint(20, 60))) + '。')
+        parts.append(' '.join(rng.choice(WORDS_EN) for _ in range(rng.randint(10, 30))) + '.')
+        if i % 3 == 2:
+            parts.append("```python\ndef handler(request):\n    return render(request)\n```")
+    return '\n\n'.join(parts)
+
+def seed_database(app, posts=100, photos=50, categories=5, authors=3, paragraphs=6, seed=0):
+    """
+    Creates the schema and fills it with deterministic synthetic rows.
+    Posts get English translations, summaries, excerpts, rendered HTML and search chunks as if the AI jobs had finished.
+    """
+    from models import db, User, Post, Category, Photo, SiteSetting
+    from app import render_post_html, content_version
+    import search
+
+    rng = random.Random(seed)
+    with app.app_context():
+        db.create_all()
+        search.ensure_index()
+        if not SiteSetting.query.first():
+            db.session.add(SiteSetting(blog_name='Bench Blog', about_content='# About\n\nBenchmark blog.', deepseek_api_key='bench'))
+        users = [User(username=f'author{seed}-{i}', password='x') for i in range(authors)]
+        cats = [Category(name=f'cat{seed}-{i}') for i in range(categories)]
+        db.session.add_all(users + cats)
+        db.session.flush()
+
+        start = datetime(2020, 1, 1)
+        for i in range(posts):
+            content = make_markdown(rng, paragraphs)
+            post = Post(
+                title=f"{rng.choice(WORDS_ZH)}{rng.choice(WORDS_ZH)} {i}",
+                title_en=f"{rng.choice(WORDS_EN).title()} {rng.choice(WORDS_EN)} {i}",
+                content=content,
+                content_en=content,
+                summary_zh=''.join(rng.choice(WORDS_ZH) for _ in range(20)),
+                summary_en=' '.join(rng.choice(WORDS_EN) for _ in range(20)),
+                created_at=start + timedelta(hours=i),
+                author_id=users[i % authors].id,
+                category_id=cats[i % categories].id if cats else None,
+            )
+            post.refresh_excerpts()
+            render_post_html(post)
+            db.session.add(post)
+            if i % 500 == 499:
+                db.session.flush()
+
+        for i in range(photos):
+            db.session.add(Photo(
+                filename=f'bench_{i}.jpg',
+                title=f'照片 {i}', title_en=f'Photo {i}',
+                description=rng.choice(WORDS_ZH), description_en=rng.choice(WORDS_EN),
+                created_at=start + timedelta(hours=i),
+            ))
+        db.session.commit()
+        if search.available():
+            search.reindex_all()
+        content_version.bump()
@@ -0,0 +1,109 @@
+"""
+Read latency while another process keeps writing, with SQLite's defaults and
+with the production engine profile (db_profile.py).
+
+A writer process keeps committing small batches of post updates (translation,
+HTML and search index rows), as the AI jobs do, while this process requests
+category listings and post pages. Each profile gets a fresh
+temporary database.
+
+    python bench/sqlite_contention.py --seconds 5
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import time
+
+def import_app(database):
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    os.environ['JOB_WORKERS'] = '0'
+    os.environ['PAGE_CACHE_MAX_ENTRIES'] = '0' # Measure the database, not the page cache
+    import app
+    return app
+
+def run_writer(args):
+    import seed # Puts the repo on sys.path
+    from sqlalchemy.exc import OperationalError
+    app_module = import_app(args.database)
+    app = app_module.app
+    from models import db, Post
+    import search
+
+    rng = random.Random(1)
+    # Rendered up front, so the loop spends its time in the database
+    bodies = [seed.make_markdown(rng, 20) for _ in range(20)]
+    bodies = [(body, app_module.render_markdown(body)) for body in bodies]
+    commits = errors = 0
+    deadline = time.monotonic() + args.seconds
+    with app.app_context():
+        ids = [row[0] for row in db.session.query(Post.id).all()]
+        while time.monotonic() < deadline:
+            try:
+                for post in Post.query.filter(Post.id.in_(rng.sample(ids, 3))).all():
+                    post.content_en, post.content_en_html = rng.choice(bodies)
+                    post.refresh_excerpts()
+                    search.index_post(post)
+                db.session.commit()
+                commits += 1
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+    print(f"WRITER {commits} {errors}")
+
+def run_reader(args):
+    from seed import use_temp_database, seed_database
+    database = use_temp_database()
+    app = import_app(database).app
+    from models import db, Category
+    import db_profile
+
+    seed_database(app, posts=args.posts, photos=0)
+    with app.app_context():
+        categories = [c.id for c in Category.query.all()]
+        with db.engine.connect() as connection:
+            pragmas = db_profile.current_pragmas(connection)
+    client = app.test_client()
+    rng = random.Random(0)
+
+    writer = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--writer', '--database', database,
+                               '--seconds', str(args.seconds)], stdout=subprocess.PIPE, text=True)
+    time.sleep(1) # Let the writer get going
+    timings, failures = [], 0
+    while writer.poll() is None:
+        url = f"/?category={rng.choice(categories)}" if rng.random() < 0.5 else f"/post/{rng.randint(1, args.posts)}"
+        start = time.perf_counter()
+        status = client.get(url).status_code
+        timings.append((time.perf_counter() - start) * 1000)
+        if status != 200:
+            failures += 1
+    commits, write_errors = writer.stdout.read().split()[1:3]
+
+    timings.sort()
+    pct = lambda p: timings[min(len(timings) - 1, int(len(timings) * p))]
+    print(f"{app.config['SQLITE_PROFILE']:<11} journal={pragmas['journal_mode']:<7} reads={len(timings):>6}  "
+          f"p50={pct(0.5):6.2f}ms p95={pct(0.95):7.2f}ms p99={pct(0.99):7.2f}ms max={timings[-1]:8.2f}ms  "
+          f"failed reads={failures}  writer commits={commits} locked={write_errors}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--reader', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--writer', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.writer:
+        run_writer(args)
+        return
+    if args.reader:
+        run_reader(args)
+        return
+    for profile in ('default', 'production'):
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--reader', '--seconds', str(args.seconds),
+                        '--posts', str(args.posts)], env=dict(os.environ, SQLITE_PROFILE=profile), check=True,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Startup cost of the app: importing it, create_app(), and how long gunicorn takes
+from launch to the first response, with and without preloading the app in the
+master, plus how much of each worker's memory is its own.
+
+Imports are timed in fresh interpreters (the median of --repeat runs):
+
+    python bench/startup.py --workers 4
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+
+IMPORT_ONLY = "import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)"
+CREATE_APP = ("import time; t = time.perf_counter(); import app; t1 = time.perf_counter(); app.create_app(); "
+              "print(time.perf_counter() - t1)")
+SEED = "import sys; sys.path.insert(0, 'bench'); from seed import seed_database; from app import app; seed_database(app, posts=200, photos=20)"
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def run_python(code, env):
+    return subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+
+def median_seconds(code, env, repeat):
+    return statistics.median(float(run_python(code, env).split()[-1]) for _ in range(repeat))
+
+def memory_kb(pid):
+    """(private, proportional) resident memory of a process in kB, from /proc."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0].endswith(':') and len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1])
+    return fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0), fields.get('Pss', 0)
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(p) for p in f.read().split()]
+
+def serve(preload, args, env):
+    """Starts gunicorn with the production config; returns (seconds to first response, worker memory)."""
+    with tempfile.NamedTemporaryFile('w', suffix='.py', delete=False) as conf:
+        conf.write(f"exec(open({os.path.join(ROOT, 'gunicorn.conf.py')!r}).read())\npreload_app = {preload}\n")
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', conf.name, '-w', str(args.workers),
+                                '-b', f"127.0.0.1:{port}", '--log-level', 'warning', 'app:create_app()'], cwd=ROOT, env=env)
+    try:
+        while True:
+            if process.poll() is not None:
+                raise SystemExit(f"gunicorn exited with code {process.returncode}")
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/post/1", timeout=5).status_code == 200:
+                    break
+            except requests.RequestException:
+                time.sleep(0.02)
+        first_response = time.perf_counter() - start
+        # Let every worker boot and serve, then measure them
+        deadline = time.monotonic() + 30
+        while len(children(process.pid)) < args.workers and time.monotonic() < deadline:
+            time.sleep(0.1)
+        time.sleep(2)
+        for _ in range(args.workers * 20):
+            requests.get(f"http://127.0.0.1:{port}/", timeout=5)
+        workers = [memory_kb(pid) for pid in children(process.pid)]
+        return first_response, workers
+    finally:
+        process.terminate()
+        process.wait()
+        os.unlink(conf.name)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters per import timing.')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='wslll_bench_')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(directory, 'blog.db')}", JOB_WORKERS='0')
+    run_python(SEED, env)
+
+    print(f"import app:       {median_seconds(IMPORT_ONLY, env, args.repeat) * 1000:7.0f} ms")
+    print(f"create_app():     {median_seconds(CREATE_APP, env, args.repeat) * 1000:7.0f} ms")
+    for preload in (False, True):
+        first_response, workers = serve(preload, args, env)
+        private = statistics.mean(w[0] for w in workers) / 1024
+        pss = sum(w[1] for w in workers) / 1024
+        print(f"gunicorn {'--preload' if preload else 'no preload'} -w {args.workers}: first response after {first_response:5.2f}s  "
+              f"private memory per worker {private:5.1f} MB  workers' PSS total {pss:6.1f} MB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Cost of the static export (static_site.py) on a large seeded database.
+
+Times a full rebuild into an empty and into an existing directory, then the
+incremental jobs a write queues: one post (its page, the home page and its
+category's listing), the gallery and the about page. For scale, it also times
+the same pages served by the app with the page cache off.
+
+    python bench/static_export.py --posts 2000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from seed import use_temp_database, seed_database
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--photos', type=int, default=200)
+    parser.add_argument('--categories', type=int, default=10)
+    parser.add_argument('--samples', type=int, default=200, help='Dynamic requests timed for comparison.')
+    args = parser.parse_args()
+
+    use_temp_database()
+    directory = tempfile.mkdtemp(prefix='wslll_export_')
+    os.environ['STATIC_EXPORT_DIR'] = directory
+    os.environ['JOB_WORKERS'] = '0'
+    os.environ['PAGE_CACHE_MAX_ENTRIES'] = '0' # Dynamic numbers measure the render path
+    os.environ['METRICS_ENABLED'] = '0'
+    from app import app, static_site, job_queue, queue_export
+
+    print(f"Seeding {args.posts} posts, {args.photos} photos, {args.categories} categories...")
+    seed_database(app, posts=args.posts, photos=args.photos, categories=args.categories)
+
+    try:
+        with app.app_context():
+            cold, pages = timed(static_site.build)
+            size = sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(directory) for name in files)
+            print(f"Full build (empty dir):    {pages:>6} pages  {cold:7.2f}s  {pages / cold:7.0f} pages/s  {size / 1e6:.1f} MB")
+            warm, pages = timed(static_site.build)
+            print(f"Full build (existing dir): {pages:>6} pages  {warm:7.2f}s  {pages / warm:7.0f} pages/s")
+
+            for label, kind, target in [('post', 'export_post', args.posts // 2), ('gallery', 'export_gallery', None), ('about', 'export_about', None)]:
+                queue_export(kind, target)
+                elapsed, _ = timed(job_queue.run_pending)
+                print(f"Incremental {label:<8} job: {elapsed * 1000:8.1f} ms")
+
+        client = app.test_client()
+        rng = random.Random(0)
+        urls = ['/', '/?category=1', '/about', '/gallery'] + [f'/post/{rng.randint(1, args.posts)}' for _ in range(args.samples)]
+        elapsed, _ = timed(lambda: [client.get(url) for url in urls])
+        print(f"Dynamic render, for scale:  {len(urls)} requests  {len(urls) / elapsed:7.0f} req/s  "
+              f"({elapsed / len(urls) * 1000:.2f} ms each, one theme and language)")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
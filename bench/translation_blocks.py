@@ -0,0 +1,58 @@
+"""
+Block-level translation of a long post against the local DeepSeek stub.
+
+Times the first translation (every block goes to the API, in parallel), a
+re-translation after editing one paragraph (one block goes to the API) and a
+rebuild with nothing changed (all blocks from the cache).
+
+    python bench/translation_blocks.py --latency 0.5 --paragraphs 120
+"""
+from gevent import monkey
+monkey.patch_all() # As the app runs in production (gunicorn.conf.py)
+
+import argparse
+import os
+import random
+import time
+
+from seed import use_temp_database, make_markdown
+from deepseek_stub import StubServer
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--latency', type=float, default=0.5, help='Simulated API latency in seconds.')
+    parser.add_argument('--paragraphs', type=int, default=120)
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.latency)
+    use_temp_database()
+    os.environ['DEEPSEEK_BASE_URL'] = server.base_url
+    os.environ['JOB_WORKERS'] = '0'
+
+    from app import app, init_db, translate_markdown
+    import translation
+    server.start()
+    init_db()
+
+    text = make_markdown(random.Random(0), args.paragraphs)
+    blocks = [chunk for translatable, chunk in translation.split_markdown(text) if translatable]
+    print(f"{len(text)} chars, {len(blocks)} translatable blocks")
+
+    def timed(label, body):
+        before = server.stats['requests']
+        start = time.perf_counter()
+        result = translate_markdown(body)
+        print(f"{label:<22} {time.perf_counter() - start:7.3f}s  api requests={server.stats['requests'] - before}")
+        return result
+
+    timed('first translation', text)
+    # Edit one word in a prose paragraph in the middle
+    paragraphs = text.split('\n\n')
+    middle = next(i for i in range(len(paragraphs) // 2, len(paragraphs)) if not paragraphs[i].startswith('```'))
+    paragraphs[middle] = paragraphs[middle] + ' 修改'
+    edited = '\n\n'.join(paragraphs)
+    timed('after one-line edit', edited)
+    timed('unchanged rebuild', edited)
+
+if __name__ == '__main__':
+    main()
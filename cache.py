@@ -0,0 +1,162 @@
+"""
+In-process caches shared by the app.
+
+Each gunicorn worker keeps its own copies, so invalidation goes through
+ContentVersion: a counter stored in a small file that any process (request
+handler or background job) can bump after committing a write, and that every
+process can check with a single stat() call.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+def atomic_write(path, data):
+    """
+    Writes `data` (str or bytes) to `path` through a temporary file and os.replace,
+    so readers see the old contents or the new ones, never part of a write.
+    """
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+class ContentVersion:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stat = None
+        self._value = 0
+
+    def get(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return 0
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if key != self._stat:
+            with open(self.path) as f:
+                try:
+                    value = int(f.read().strip() or 0)
+                except ValueError:
+                    value = 0
+            self._stat, self._value = key, value
+        return self._value
+
+    def bump(self):
+        """
+        Marks everything cached under the old version as stale, in every process.
+        Call it after the write has been committed. The value is a nanosecond
+        timestamp, so it doubles as a last-modified time.
+        """
+        with self._lock:
+            value = max(time.time_ns(), self.get() + 1)
+            atomic_write(self.path, str(value))
+            return value
+
+class VersionedValue:
+    """Result of `loader()`, reloaded whenever the ContentVersion changes."""
+
+    def __init__(self, version, loader):
+        self.version = version
+        self.loader = loader
+        self._entry = None
+
+    def get(self):
+        # Read the version before loading, so a write committed mid-load is
+        # picked up on the next call instead of being cached as current
+        version = self.version.get()
+        entry = self._entry
+        if entry is None or entry[0] != version:
+            entry = (version, self.loader())
+            self._entry = entry
+        return entry[1]
+
+class CachedPage:
+    __slots__ = ('version', 'body', 'mimetype', 'etag', 'last_modified')
+
+    def __init__(self, version, body, mimetype):
+        self.version = version
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+        # The version is the time of the last content write, which is what the page reflects
+        self.last_modified = datetime.fromtimestamp(version / 1e9, timezone.utc) if version else None
+
+class PageCache:
+    """
+    Size-bounded LRU of rendered responses. Entries remember the ContentVersion
+    they were rendered at and are dropped on lookup once it has moved on.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.version != version:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, version, body, mimetype):
+        entry = CachedPage(version, body, mimetype)
+        if len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries))) # Least recently used
+        return entry
+
+    def _remove(self, key):
+        self._bytes -= len(self._entries.pop(key).body)
+
+class TTLCache:
+    """Small LRU whose entries also expire `ttl` seconds after they were stored."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict() # key -> (expires at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False) # Least recently used
@@ -0,0 +1,66 @@
+"""
+SQLite connection settings for serving.
+
+Background jobs write while request greenlets read. With SQLite's default
+rollback journal, readers and the writer block each other and "database is
+locked" comes back immediately. The "production" profile applies these PRAGMAs
+to every new connection:
+
+- journal_mode=WAL: readers keep reading while one writer commits.
+- busy_timeout: a writer waits for the lock instead of failing at once.
+- synchronous=NORMAL: in WAL mode this only fsyncs at checkpoints. It is still
+  safe against corruption; a power cut can lose the last commits.
+- cache_size / mmap_size: more of the database is kept in memory.
+
+SQLITE_PROFILE=default leaves SQLite's own defaults alone. Each value can also
+be set on its own (SQLITE_BUSY_TIMEOUT etc.); an empty value skips that PRAGMA.
+Other databases are not touched.
+"""
+import os
+
+from sqlalchemy import event
+
+PROFILES = {
+    'production': {
+        'SQLITE_JOURNAL_MODE': 'WAL',
+        'SQLITE_BUSY_TIMEOUT': '5000', # Milliseconds
+        'SQLITE_SYNCHRONOUS': 'NORMAL',
+        'SQLITE_CACHE_SIZE': '-16000', # Negative is KiB: ~16 MB page cache per connection
+        'SQLITE_MMAP_SIZE': str(256 * 1024 * 1024),
+    },
+    'default': {},
+}
+# Config key -> PRAGMA, in the order they are applied
+PRAGMAS = [
+    ('SQLITE_BUSY_TIMEOUT', 'busy_timeout'), # First, so switching the journal mode waits for locks too
+    ('SQLITE_JOURNAL_MODE', 'journal_mode'),
+    ('SQLITE_SYNCHRONOUS', 'synchronous'),
+    ('SQLITE_CACHE_SIZE', 'cache_size'),
+    ('SQLITE_MMAP_SIZE', 'mmap_size'),
+]
+
+def init_app(app, db):
+    """Registers the PRAGMAs on the app's engine. Call after db.init_app(app)."""
+    profile = os.environ.get('SQLITE_PROFILE', 'production')
+    app.config.setdefault('SQLITE_PROFILE', profile)
+    for key, _ in PRAGMAS:
+        app.config.setdefault(key, os.environ.get(key, PROFILES.get(profile, {}).get(key, '')))
+    pragmas = [(name, str(app.config[key])) for key, name in PRAGMAS if str(app.config[key]).strip()]
+
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+def current_pragmas(connection):
+    """{pragma: value} as seen by `connection`, for checking the profile took effect."""
+    return {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for _, name in PRAGMAS}
@@ -0,0 +1,115 @@
+"""
+Process-wide DeepSeek (OpenAI-compatible) client.
+
+Building an OpenAI client per call means a new HTTP connection pool, and a new
+TCP + TLS handshake, for every translation, summary and chat message.
+DeepSeekClient keeps one client with a keep-alive pool per process and only
+rebuilds it when the API key saved through /settings changes. It also caps the
+number of background (non-streaming) requests in flight at once, so a burst of
+jobs cannot flood the API or exhaust the pool.
+
+Every call is reported to `on_call(op, seconds, usage, error)` if given (used
+for the metrics in metrics.py); streams are reported when they end.
+"""
+import threading
+import time
+
+class DeepSeekClient:
+    def __init__(self, base_url, key_getter, model='deepseek-chat', timeout=120.0, connect_timeout=10.0,
+                 max_connections=20, max_keepalive=10, max_retries=2, max_in_flight=8, on_call=None):
+        self.base_url = base_url
+        self.key_getter = key_getter
+        self.model = model
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.max_retries = max_retries
+        self.on_call = on_call
+        self._client = None
+        self._key = None
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    @classmethod
+    def from_config(cls, config, key_getter, on_call=None):
+        return cls(
+            config['DEEPSEEK_BASE_URL'], key_getter,
+            model=config['DEEPSEEK_MODEL'],
+            timeout=config['DEEPSEEK_TIMEOUT'],
+            connect_timeout=config['DEEPSEEK_CONNECT_TIMEOUT'],
+            max_connections=config['DEEPSEEK_MAX_CONNECTIONS'],
+            max_keepalive=config['DEEPSEEK_MAX_KEEPALIVE'],
+            max_in_flight=config['DEEPSEEK_MAX_IN_FLIGHT'],
+            on_call=on_call,
+        )
+
+    def get(self):
+        """Returns the shared client, rebuilding it if the API key changed."""
+        key = self.key_getter()
+        if self._client is None or self._key != key:
+            with self._lock:
+                if self._client is None or self._key != key:
+                    # The old client is left to the garbage collector, so calls
+                    # still running on it are not cut off
+                    self._client = self._build(key)
+                    self._key = key
+        return self._client
+
+    def _build(self, key):
+        # Imported here: the OpenAI SDK is slow to import and only needed once AI work starts
+        import openai
+        # Built from the SDK's own classes, whichever HTTP library (httpx or httpx2) its release uses
+        Limits = type(openai.DEFAULT_CONNECTION_LIMITS)
+        http_client = openai.DefaultHttpxClient(
+            limits=Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_keepalive),
+            timeout=openai.Timeout(self.timeout, connect=self.connect_timeout),
+        )
+        return openai.OpenAI(api_key=key, base_url=self.base_url, http_client=http_client, max_retries=self.max_retries)
+
+    def chat(self, messages, stream=False, op='chat', **kwargs):
+        """
+        chat.completions.create on the shared client with the configured model.
+        Non-streaming calls wait for a free in-flight slot; streaming replies are
+        interactive and are not queued behind background work. `op` names the
+        call (chat, translate, summary) for on_call.
+        """
+        client = self.get()
+        start = time.perf_counter()
+        if stream:
+            try:
+                response = client.chat.completions.create(model=self.model, messages=messages, stream=True, **kwargs)
+            except Exception as e:
+                self._report(op, start, None, e)
+                raise
+            return self._observe_stream(op, response, start)
+        with self._in_flight:
+            try:
+                response = client.chat.completions.create(model=self.model, messages=messages, **kwargs)
+            except Exception as e:
+                self._report(op, start, None, e)
+                raise
+        self._report(op, start, getattr(response, 'usage', None), None)
+        return response
+
+    def _observe_stream(self, op, response, start):
+        usage = error = None
+        try:
+            for chunk in response:
+                usage = getattr(chunk, 'usage', None) or usage # Sent with the last chunk, if at all
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            close = getattr(response, 'close', None)
+            if close:
+                close() # Returns the connection to the pool if the reader went away early
+            self._report(op, start, usage, error)
+
+    def _report(self, op, start, usage, error):
+        if self.on_call:
+            try:
+                self.on_call(op, time.perf_counter() - start, usage, error)
+            except Exception as e:
+                print(f"DeepSeek call observer failed: {e}")
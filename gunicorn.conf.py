@@ -0,0 +1,29 @@
+"""
+gunicorn settings for production:
+
+    gunicorn -c gunicorn.conf.py 'app:create_app()'
+
+The app is loaded once in the master (preload_app) and the workers are forked
+from it, so the modules, templates and Markdown/Pygments stack that
+create_app() loads are shared between workers instead of being imported by
+each one. gevent's monkey patching happens here, before the app is imported:
+locks, queues and thread pools the app creates at import must already be the
+cooperative ones when the workers inherit them.
+
+Settings can be overridden on the command line or with GUNICORN_CMD_ARGS.
+"""
+import os
+
+from gevent import monkey
+monkey.patch_all()
+
+bind = os.environ.get('BIND', '0.0.0.0:15013')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+worker_class = 'gevent'
+preload_app = True
+
+def post_worker_init(worker):
+    # Background jobs run in the serving processes only (jobs.py); start them at boot
+    # rather than on the first request, so jobs left from before a restart run
+    from app import job_queue
+    job_queue.start()
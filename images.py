@@ -0,0 +1,67 @@
+"""
+Derived image sizes for the gallery.
+
+Originals are kept as uploaded. Next to them, photos/variants/ holds resized
+JPEG and WebP copies that the gallery templates offer through srcset, so a grid
+cell downloads a few hundred KB instead of the full upload.
+
+Pillow is optional: without it no variants are built and the gallery keeps
+serving the originals. It is imported on first use, by the background job,
+so web workers that never resize don't load it.
+"""
+import os
+
+VARIANT_WIDTHS = (480, 960, 1600)
+VARIANT_DIR = 'variants'
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+# Accepted upload types and the suffix they are stored with. Originals are served
+# as static files, so anything a browser would run (.html, .svg) stays out.
+SUFFIXES = {'.jpg': '.jpg', '.jpeg': '.jpg', '.png': '.png', '.gif': '.gif', '.webp': '.webp'}
+
+def variant_filename(filename, width, ext):
+    stem = os.path.splitext(filename)[0]
+    return f"{VARIANT_DIR}/{stem}_{width}.{ext}"
+
+def stored_suffix(filename):
+    """Suffix to store an upload named `filename` with, or None if it is not an accepted image type."""
+    return SUFFIXES.get(os.path.splitext(filename or '')[1].lower())
+
+def build_variants(photos_dir, filename):
+    """
+    Writes the JPEG and WebP variants of one photo.
+    Returns (width, height, variant_widths) of the original, or None if Pillow
+    is missing or the file cannot be read as an image.
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+    os.makedirs(os.path.join(photos_dir, VARIANT_DIR), exist_ok=True)
+    try:
+        with Image.open(os.path.join(photos_dir, filename)) as img:
+            img = ImageOps.exif_transpose(img)
+            width, height = img.size
+            # Never upscale: small photos get a single variant at their own width
+            widths = sorted({min(w, width) for w in VARIANT_WIDTHS}, reverse=True)
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+            # Largest first, each size is resized from the previous one
+            current = img
+            for w in widths:
+                if current.width != w:
+                    current = current.resize((w, max(1, round(height * w / width))), Image.LANCZOS)
+                current.save(os.path.join(photos_dir, variant_filename(filename, w, 'webp')), 'WEBP', quality=WEBP_QUALITY, method=4)
+                current.convert('RGB').save(os.path.join(photos_dir, variant_filename(filename, w, 'jpg')), 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    except (OSError, Image.DecompressionBombError) as e:
+        print(f"Variant generation failed for {filename}: {e}")
+        return None
+    return width, height, sorted(widths)
+
+def remove_variants(photos_dir, filename, widths):
+    for w in widths:
+        for ext in ('jpg', 'webp'):
+            try:
+                os.remove(os.path.join(photos_dir, variant_filename(filename, w, ext)))
+            except OSError:
+                pass
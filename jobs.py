@@ -0,0 +1,231 @@
+"""
+Persistent background job queue.
+
+Jobs (AI translation/summaries, image variants, ...) are rows in the `job` table
+of the blog database, so they survive restarts. Each process runs a fixed pool
+of JOB_WORKERS worker threads (greenlets under gevent) that claim due jobs with
+an atomic UPDATE, retry failures with exponential backoff and mark a job failed
+after JOB_MAX_ATTEMPTS. A claim is a lease that is renewed while the handler
+runs; a job whose worker died is claimed again once its lease runs out.
+
+Handlers receive the job's target id and load the current row themselves, so
+queueing the same (kind, target) again while a job is still pending is a no-op:
+the pending job will process the latest content anyway.
+"""
+import os
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, or_, and_, update, delete
+
+from models import db, Job
+
+class JobQueue:
+    def __init__(self, app=None):
+        self.handlers = {}
+        self.app = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOB_WORKERS', int(os.environ.get('JOB_WORKERS', 2)))
+        app.config.setdefault('JOB_MAX_ATTEMPTS', int(os.environ.get('JOB_MAX_ATTEMPTS', 5)))
+        app.config.setdefault('JOB_RETRY_DELAY', 30) # Seconds before the first retry, doubled each time
+        app.config.setdefault('JOB_LEASE', 600) # Seconds before a job claimed by a dead worker is retried
+        app.config.setdefault('JOB_POLL_INTERVAL', 5)
+        self.app = app
+        app.extensions['job_queue'] = self
+        app.cli.add_command(jobs_cli)
+
+    def handler(self, kind):
+        """Registers `func(target_id)` as the handler for jobs of `kind`."""
+        def decorator(func):
+            self.handlers[kind] = func
+            return func
+        return decorator
+
+    def enqueue(self, kind, target_id=None):
+        """
+        Queues a job unless the same (kind, target_id) is already pending.
+        Call after committing the data the job reads. Only inserts the row: the
+        workers run in the serving processes (see start), so jobs queued by CLI
+        commands and scripts are not claimed by threads that die with them.
+        """
+        exists = Job.query.filter_by(kind=kind, target_id=target_id, status='pending').first()
+        if not exists:
+            db.session.add(Job(kind=kind, target_id=target_id))
+            db.session.commit()
+        self._wake.set() # Workers of this process, if it has any, look right away
+
+    def start(self):
+        """
+        Starts this process's worker pool (once per process, also after a fork).
+        Called by processes that serve requests: the gunicorn workers at boot, and
+        the app before each request.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._wake = threading.Event()
+            for i in range(self.app.config['JOB_WORKERS']):
+                threading.Thread(target=self._worker, name=f'job-worker-{i}', daemon=True).start()
+
+    def _worker(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    job = self._claim()
+                    if job:
+                        self._run(job)
+                        continue
+            except Exception:
+                traceback.print_exc()
+            self._wake.wait(self.app.config['JOB_POLL_INTERVAL'])
+            self._wake.clear()
+
+    def _claim(self):
+        now = datetime.utcnow()
+        due = or_(
+            and_(Job.status == 'pending', Job.run_after <= now),
+            and_(Job.status == 'running', Job.locked_until < now), # Worker died mid-job
+        )
+        candidates = Job.query.filter(due).order_by(Job.run_after, Job.id).limit(5).all()
+        for job in candidates:
+            # Only one worker (in any process) wins the UPDATE
+            claimed = db.session.execute(
+                update(Job).where(Job.id == job.id, due).values(
+                    status='running',
+                    attempts=Job.attempts + 1,
+                    locked_until=now + timedelta(seconds=self.app.config['JOB_LEASE']),
+                    updated_at=now,
+                )
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                db.session.refresh(job)
+                return job
+        return None
+
+    def _run(self, job):
+        # Plain values: the row may be gone (or another worker's) by the time the handler returns
+        job_id, kind, target_id, attempts = job.id, job.kind, job.target_id, job.attempts
+        handler = self.handlers.get(kind)
+        lease = Lease(self.app, job_id, job.locked_until)
+        lease.start()
+        try:
+            if handler is None:
+                raise LookupError(f"No handler for job kind '{kind}'")
+            handler(target_id)
+        except Exception as e:
+            db.session.rollback()
+            lease.stop()
+            print(f"Job {job_id} ({kind} {target_id}) failed on attempt {attempts}: {e}")
+            now = datetime.utcnow()
+            values = {'last_error': f"{type(e).__name__}: {e}", 'updated_at': now}
+            if attempts >= self.app.config['JOB_MAX_ATTEMPTS']:
+                values['status'] = 'failed'
+            else:
+                values['status'] = 'pending'
+                values['run_after'] = now + timedelta(seconds=self.app.config['JOB_RETRY_DELAY'] * 2 ** (attempts - 1))
+            finished = db.session.execute(update(Job).where(*lease.held()).values(**values)).rowcount
+        else:
+            lease.stop()
+            finished = db.session.execute(delete(Job).where(*lease.held())).rowcount
+        db.session.commit()
+        if not finished:
+            print(f"Job {job_id} ({kind} {target_id}) outlived its lease and was claimed again; result of this run not recorded.")
+
+    def run_pending(self):
+        """Processes every due job in the calling thread. Returns the number processed."""
+        count = 0
+        while True:
+            job = self._claim()
+            if not job:
+                return count
+            self._run(job)
+            count += 1
+
+class Lease:
+    """
+    Extends a running job's claim every third of JOB_LEASE while its handler runs,
+    so a slow job (a long translation) is not taken for a dead worker's and run twice.
+    The job is only finished by whoever still holds the lease (held()).
+    """
+
+    def __init__(self, app, job_id, locked_until):
+        self.app = app
+        self.job_id = job_id
+        self.locked_until = locked_until
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._renew, name=f'job-lease-{job_id}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def held(self):
+        """WHERE clause matching the job only while this lease is still its claim."""
+        return Job.id == self.job_id, Job.locked_until == self.locked_until
+
+    def _renew(self):
+        seconds = self.app.config['JOB_LEASE']
+        while not self._stop.wait(seconds / 3):
+            until = datetime.utcnow() + timedelta(seconds=seconds)
+            try:
+                with self.app.app_context():
+                    renewed = db.session.execute(update(Job).where(*self.held()).values(locked_until=until)).rowcount
+                    db.session.commit()
+            except Exception:
+                traceback.print_exc() # Try again next time; the lease is still valid for a while
+                continue
+            if not renewed:
+                return # Claimed again already
+            self.locked_until = until
+
+jobs_cli = AppGroup('jobs', help='Inspect and manage the background job queue.')
+
+@jobs_cli.command('status')
+@click.option('--failures', default=10, help='Number of recent failures to list.')
+def status_command(failures):
+    """Show queue depth per kind/status and the most recent failures."""
+    rows = db.session.query(Job.kind, Job.status, func.count(Job.id), func.min(Job.created_at)).group_by(Job.kind, Job.status).all()
+    if not rows:
+        click.echo('Queue is empty.')
+    for kind, status, count, oldest in rows:
+        age = datetime.utcnow() - oldest if oldest else timedelta(0)
+        click.echo(f"{kind:<20} {status:<8} {count:>6}  oldest {int(age.total_seconds())}s ago")
+    failed = Job.query.filter_by(status='failed').order_by(Job.updated_at.desc()).limit(failures).all()
+    if failed:
+        click.echo('\nRecent failures:')
+        for job in failed:
+            click.echo(f"  #{job.id} {job.kind} {job.target_id} after {job.attempts} attempts: {job.last_error}")
+
+@jobs_cli.command('retry')
+@click.argument('job_ids', nargs=-1, type=int)
+def retry_command(job_ids):
+    """Requeue failed jobs (all of them, or the given ids)."""
+    query = Job.query.filter_by(status='failed')
+    if job_ids:
+        query = query.filter(Job.id.in_(job_ids))
+    count = query.update({'status': 'pending', 'attempts': 0, 'run_after': datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    click.echo(f"Requeued {count} jobs.")
+
+@jobs_cli.command('run')
+def run_command():
+    """Process all due jobs in the foreground, then exit."""
+    count = current_app.extensions['job_queue'].run_pending()
+    click.echo(f"Processed {count} jobs.")
@@ -0,0 +1,316 @@
+"""
+Request timing, SQL accounting and Prometheus metrics.
+
+Every request records its wall time, the number and total time of its SQL
+statements (SQLAlchemy cursor events) and the time spent rendering templates.
+They are returned in a Server-Timing header, which browsers show in the network
+panel:
+
+    Server-Timing: sql;dur=2.1;desc="3 queries", tpl;dur=4.8, app;dur=9.6
+
+DeepSeek calls are timed and their token usage counted per operation, as
+reported by deepseek.py.
+
+Everything is aggregated into histograms per route and served at /metrics in
+the Prometheus text format. Each gunicorn worker keeps its own numbers and
+writes them to METRICS_DIR every few seconds. /metrics adds up all workers,
+including those that have exited, so counters only go up.
+"""
+import atexit
+import fcntl
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, request, current_app, has_request_context, abort, Response, template_rendered, before_render_template
+from flask_login import current_user
+from sqlalchemy import event
+
+import ai_cache
+from cache import atomic_write
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+AI_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+HISTOGRAMS = {
+    'blog_http_request_duration_seconds': ('Request wall time per route (streamed responses until they end).', DURATION_BUCKETS),
+    'blog_sql_queries_per_request': ('SQL statements per request, per route.', QUERY_BUCKETS),
+    'blog_sql_duration_seconds': ('Time spent in SQL per request, per route.', DURATION_BUCKETS),
+    'blog_template_render_seconds': ('Time spent rendering templates per request, per route.', DURATION_BUCKETS),
+    'blog_ai_request_duration_seconds': ('DeepSeek call latency per operation (streams until they end).', AI_BUCKETS),
+}
+COUNTERS = {
+    'blog_http_requests_total': 'Requests per route, method and status.',
+    'blog_ai_requests_total': 'DeepSeek calls per operation and outcome.',
+    'blog_ai_tokens_total': 'DeepSeek tokens used per operation and kind.',
+    'blog_ai_cache_lookups_total': 'DeepSeek output cache lookups per operation and result.',
+}
+
+def _key(labels):
+    return json.dumps(sorted(labels.items()))
+
+class Registry:
+    """Counters and histograms of one process, as plain dicts that can be saved as JSON."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {} # name -> {labels key: value}
+        self.histograms = {} # name -> {labels key: [count per bucket..., count above, sum]}
+
+    def inc(self, name, labels, value=1):
+        key = _key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        key = _key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = [0] * (len(buckets) + 2)
+            series[key][bisect_left(buckets, value)] += 1
+            series[key][-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            data = {
+                'counters': {name: dict(series) for name, series in self.counters.items()},
+                'histograms': {name: {key: list(values) for key, values in series.items()} for name, series in self.histograms.items()},
+            }
+        lookups = data['counters'].setdefault('blog_ai_cache_lookups_total', {})
+        for op, counts in ai_cache.counters().items():
+            lookups[_key({'op': op, 'result': 'hit'})] = counts['hits']
+            lookups[_key({'op': op, 'result': 'miss'})] = counts['misses']
+        return data
+
+def merge(total, data):
+    """Adds snapshot `data` into `total`."""
+    for name, series in data.get('counters', {}).items():
+        target = total.setdefault('counters', {}).setdefault(name, {})
+        for key, value in series.items():
+            target[key] = target.get(key, 0) + value
+    for name, series in data.get('histograms', {}).items():
+        target = total.setdefault('histograms', {}).setdefault(name, {})
+        for key, values in series.items():
+            if key in target and len(target[key]) == len(values):
+                target[key] = [a + b for a, b in zip(target[key], values)]
+            else:
+                target[key] = list(values)
+    return total
+
+def _labels(key, **extra):
+    pairs = json.loads(key) + list(extra.items())
+    if not pairs:
+        return ''
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+def render(data):
+    """Prometheus text exposition format of snapshot `data`."""
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for key, values in sorted(data.get('histograms', {}).get(name, {}).items()):
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), values[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(key, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(key)} {values[-1]:.6f}")
+            lines.append(f"{name}_count{_labels(key)} {cumulative}")
+    for name, help_text in COUNTERS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for key, value in sorted(data.get('counters', {}).get(name, {}).items()):
+            lines.append(f"{name}{_labels(key)} {value}")
+    return '\n'.join(lines) + '\n'
+
+class ProcessStore:
+    """
+    One JSON snapshot per process in `directory`. Snapshots of processes that have
+    exited are folded into one archive file, so the directory does not grow with
+    worker restarts and their counts are kept.
+    """
+    ARCHIVE = 'exited.json'
+
+    def __init__(self, directory):
+        self.directory = directory # Created on first write, not when the app is imported
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, path, data):
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_write(path, json.dumps(data))
+
+    def save(self, data):
+        self._write(os.path.join(self.directory, f"{os.getpid()}.json"), data)
+
+    def collect(self):
+        """Sum of all processes' snapshots."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX) # One process folds exited snapshots at a time
+            archive_path = os.path.join(self.directory, self.ARCHIVE)
+            archive = self._read(archive_path)
+            live = []
+            exited = []
+            for name in os.listdir(self.directory):
+                stem, ext = os.path.splitext(name)
+                if ext != '.json' or not stem.isdigit():
+                    continue
+                path = os.path.join(self.directory, name)
+                (live if _running(int(stem)) else exited).append(path)
+            if exited:
+                for path in exited:
+                    merge(archive, self._read(path))
+                self._write(archive_path, archive)
+                for path in exited:
+                    os.remove(path)
+            total = merge({}, archive)
+            for path in live:
+                merge(total, self._read(path))
+            return total
+
+def _running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+registry = Registry()
+_store = None
+_flush_interval = 5
+_last_save = 0.0
+_started = False
+
+def save(force=False):
+    """Writes this process's snapshot, at most every METRICS_FLUSH_INTERVAL seconds unless forced."""
+    global _last_save
+    now = time.monotonic()
+    if _store is None or (not force and now - _last_save < _flush_interval):
+        return
+    _last_save = now
+    try:
+        _store.save(registry.snapshot())
+    except OSError as e:
+        print(f"Could not save metrics: {e}")
+
+def init_app(app, db):
+    """Hooks request, SQL and template timing into `app`. Call after db.init_app(app)."""
+    global _store, _flush_interval
+    app.config.setdefault('METRICS_ENABLED', os.environ.get('METRICS_ENABLED', '1') != '0')
+    app.config.setdefault('METRICS_DIR', os.environ.get('METRICS_DIR') or os.path.join(app.instance_path, 'metrics'))
+    app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN'))
+    app.config.setdefault('METRICS_AUTH', os.environ.get('METRICS_AUTH', '1') != '0') # 0: /metrics is open to anyone
+    app.config.setdefault('METRICS_FLUSH_INTERVAL', float(os.environ.get('METRICS_FLUSH_INTERVAL', 5)))
+    app.config.setdefault('SERVER_TIMING', os.environ.get('SERVER_TIMING', '1') != '0')
+    if not app.config['METRICS_ENABLED']:
+        return
+    _store = ProcessStore(app.config['METRICS_DIR'])
+    _flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+
+    with app.app_context():
+        engine = db.engine
+
+    # The start time lives on the statement's execution context: a statement that raises
+    # never reaches after_cursor_execute, and its start must not stay behind on the connection
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_start
+        timing = g.get('timing') if has_request_context() else None
+        if timing is not None:
+            timing['sql_count'] += 1
+            timing['sql_time'] += elapsed
+
+    def before_template(sender, template, context, **extra):
+        timing = g.get('timing') if has_request_context() else None
+        if timing is not None:
+            timing['templates'].append(time.perf_counter())
+
+    def after_template(sender, template, context, **extra):
+        timing = g.get('timing') if has_request_context() else None
+        if timing is not None and timing['templates']:
+            elapsed = time.perf_counter() - timing['templates'].pop()
+            if not timing['templates']: # Nested renders are already inside the outer one
+                timing['template_time'] += elapsed
+
+    before_render_template.connect(before_template, app, weak=False)
+    template_rendered.connect(after_template, app, weak=False)
+    # Registered before the app's own hooks, so the timing covers them (including page cache hits)
+    app.before_request(start_timing)
+    app.after_request(finish_timing)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+def start():
+    """
+    Called by processes that serve requests (create_app): their last numbers are saved
+    when they exit. CLI commands and scripts that only import the app write nothing.
+    """
+    global _started
+    if _store is not None and not _started:
+        _started = True
+        atexit.register(save, force=True)
+
+def start_timing():
+    g.timing = {'start': time.perf_counter(), 'sql_count': 0, 'sql_time': 0.0, 'template_time': 0.0, 'templates': []}
+
+def finish_timing(response):
+    timing = g.get('timing')
+    if timing is None:
+        return response
+    if current_app.config['SERVER_TIMING']:
+        response.headers.add('Server-Timing', ', '.join([
+            f'sql;dur={timing["sql_time"] * 1000:.1f};desc="{timing["sql_count"]} queries"',
+            f'tpl;dur={timing["template_time"] * 1000:.1f}',
+            f'app;dur={(time.perf_counter() - timing["start"]) * 1000:.1f}',
+        ]))
+    labels = {'route': request.endpoint or 'unmatched'}
+    method, status = request.method, response.status_code
+
+    def record():
+        registry.inc('blog_http_requests_total', dict(labels, method=method, status=str(status)))
+        registry.observe('blog_http_request_duration_seconds', labels, time.perf_counter() - timing['start'])
+        registry.observe('blog_sql_queries_per_request', labels, timing['sql_count'])
+        registry.observe('blog_sql_duration_seconds', labels, timing['sql_time'])
+        registry.observe('blog_template_render_seconds', labels, timing['template_time'])
+        save()
+
+    if response.is_streamed:
+        response.call_on_close(record) # Counted when the stream ends
+    else:
+        record()
+    return response
+
+def record_ai_call(op, seconds, usage, error):
+    """on_call hook for DeepSeekClient."""
+    registry.observe('blog_ai_request_duration_seconds', {'op': op}, seconds)
+    registry.inc('blog_ai_requests_total', {'op': op, 'status': 'error' if error else 'ok'})
+    if usage is not None:
+        registry.inc('blog_ai_tokens_total', {'op': op, 'kind': 'prompt'}, getattr(usage, 'prompt_tokens', 0) or 0)
+        registry.inc('blog_ai_tokens_total', {'op': op, 'kind': 'completion'}, getattr(usage, 'completion_tokens', 0) or 0)
+
+def metrics_view():
+    # The client address proves nothing behind a reverse proxy, so there is no local exception
+    token = current_app.config['METRICS_TOKEN']
+    authorization = request.headers.get('Authorization', '')
+    if current_app.config['METRICS_AUTH'] and not current_user.is_authenticated \
+            and not (token and hmac.compare_digest(authorization, f"Bearer {token}")):
+        abort(403)
+    save(force=True)
+    return Response(render(_store.collect()), mimetype='text/plain; version=0.0.4')
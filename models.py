@@ -1,15 +1,22 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
 from datetime import datetime
 import json
 
 db = SQLAlchemy()
 
+EXCERPT_LENGTH = 200 # Characters of Markdown shown on listing cards
+
 class SiteSetting(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     blog_name = db.Column(db.String(100), default="My Blog")
     about_content = db.Column(db.Text, nullable=True)
     about_content_en = db.Column(db.Text, nullable=True)
+    about_content_html = db.Column(db.Text, nullable=True) # Rendered about_content
+    about_content_en_html = db.Column(db.Text, nullable=True) # Rendered about_content_en
+    about_html_version = db.Column(db.Integer, nullable=True) # Renderer version of the HTML above
     social_links = db.Column(db.Text, default="[]") # JSON string
     logo_filename = db.Column(db.String(200), nullable=True)
     deepseek_api_key = db.Column(db.String(200), nullable=True)
@@ -46,12 +53,28 @@ class Post(db.Model):
     content_en = db.Column(db.Text, nullable=True) # Markdown content (English Translation)
     summary_zh = db.Column(db.Text, nullable=True) # AI Summary (Chinese)
     summary_en = db.Column(db.Text, nullable=True) # AI Summary (English)
+    excerpt = db.Column(db.String(EXCERPT_LENGTH), nullable=True) # Listing excerpt of content
+    excerpt_en = db.Column(db.String(EXCERPT_LENGTH), nullable=True) # Listing excerpt of content_en
+    content_html = db.Column(db.Text, nullable=True) # Rendered content
+    content_en_html = db.Column(db.Text, nullable=True) # Rendered content_en
+    html_version = db.Column(db.Integer, nullable=True) # Renderer version of the HTML above
+    revision = db.Column(db.Integer, default=0, nullable=False) # Bumped on every edit; AI results are only saved for the revision they were made from
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     custom_author = db.Column(db.String(100), nullable=True) # Manually set author name
     author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     author = db.relationship('User', backref=db.backref('posts', lazy=True))
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_post_created_at_id', 'created_at', 'id'), # Keyset pagination order
+        db.Index('ix_post_category_created_at', 'category_id', 'created_at', 'id'), # Category listings, same order
+    )
+
+    def refresh_excerpts(self):
+        # Listings only read these, so the full bodies never have to be loaded there
+        self.excerpt = (self.content or '')[:EXCERPT_LENGTH]
+        self.excerpt_en = self.content_en[:EXCERPT_LENGTH] if self.content_en else None
+
 class Photo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(100), nullable=False)
@@ -60,3 +83,79 @@ class Photo(db.Model):
     description = db.Column(db.String(200))
     description_en = db.Column(db.String(200)) # English Description
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    width = db.Column(db.Integer, nullable=True) # Original size, for layout hints
+    height = db.Column(db.Integer, nullable=True)
+    variant_widths = db.Column(db.String(50), nullable=True) # Comma-separated widths of the resized copies
+
+    __table_args__ = (
+        db.Index('ix_photo_created_at_id', 'created_at', 'id'), # Keyset pagination order
+        db.Index('ix_photo_filename', 'filename'), # Photos sharing a stored file (photo_store.py)
+    )
+
+    def get_variant_widths(self):
+        return [int(w) for w in self.variant_widths.split(',')] if self.variant_widths else []
+
+class Job(db.Model):
+    """Queued background work, processed by the workers in jobs.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False) # e.g. 'process_post'
+    target_id = db.Column(db.Integer, nullable=True) # Row the job works on
+    status = db.Column(db.String(20), default='pending', nullable=False) # pending / running / failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False) # Retry backoff
+    locked_until = db.Column(db.DateTime, nullable=True) # Lease of the worker running it
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+        db.Index('ix_job_kind_target', 'kind', 'target_id', 'status'),
+    )
+
+class AICacheEntry(db.Model):
+    """Stored DeepSeek output, keyed by a hash of its input (see ai_cache.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    op = db.Column(db.String(50), nullable=False) # e.g. 'translate_block'
+    lang = db.Column(db.String(10), nullable=False) # Target language
+    prompt_version = db.Column(db.Integer, nullable=False)
+    input_hash = db.Column(db.String(64), nullable=False) # SHA-256 of the input text
+    output = db.Column(db.Text, nullable=False)
+    hits = db.Column(db.Integer, default=0, nullable=False) # Lookups answered by this entry
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow) # Eviction order
+
+    __table_args__ = (
+        db.Index('ux_ai_cache_key', 'op', 'lang', 'prompt_version', 'input_hash', unique=True),
+        db.Index('ix_ai_cache_last_used', 'last_used_at'),
+    )
+
+def upgrade_schema():
+    """
+    Brings an existing database up to date with the models.
+    db.create_all() only creates missing tables, so new columns and indexes on
+    existing tables are added here. Safe to run repeatedly (and from several workers).
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(dialect=engine.dialect)}"
+            if column.default is not None and column.default.is_scalar:
+                ddl += f" DEFAULT {column.default.arg!r}"
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(ddl))
+            except OperationalError:
+                pass # Another worker added it first
+        for index in table.indexes:
+            try:
+                index.create(engine, checkfirst=True)
+            except OperationalError:
+                pass
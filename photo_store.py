@@ -0,0 +1,73 @@
+"""
+Content-addressed storage for gallery photos.
+
+Each photo file is stored once, as <sha256 of its bytes><ext> in the photos
+directory, however many Photo rows show it. Rows sharing a file also share its
+resized variants, so the file is only deleted once no row references it.
+
+The hash is computed while the upload streams in: the app's request class
+gives Werkzeug's multipart parser a HashingFile in the photos directory, which
+hashes each chunk as the parser writes it there. Storing the upload is then a
+rename, not another copy of the whole file.
+"""
+import hashlib
+import os
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+
+class HashingFile:
+    """Temporary file in `directory` that hashes everything written to it. Deleted on close unless stored."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', suffix='.tmp', delete=False)
+        self.path = self.file.name
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        self.hash.update(data)
+        return self.file.write(data)
+
+    def close(self):
+        self.file.close()
+        remove(self.path) # Gone already if it was stored
+
+    def __getattr__(self, name):
+        return getattr(self.file, name) # read, seek, tell... for FileStorage
+
+def store(file_storage, directory, ext):
+    """Moves an uploaded file into the store and returns its filename (<hash><ext>)."""
+    stream = file_storage.stream
+    if not isinstance(stream, HashingFile):
+        # Not streamed through the request class (e.g. a spooled upload): hash it while copying
+        copy = HashingFile(directory)
+        try:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                copy.write(chunk)
+        except BaseException:
+            copy.close()
+            raise
+        stream = copy
+    stream.file.close()
+    filename = stream.hash.hexdigest() + ext
+    target = os.path.join(directory, filename)
+    if os.path.exists(target):
+        remove(stream.path) # The same bytes are already stored
+    else:
+        os.chmod(stream.path, 0o644) # Temp files are private; photos are served to everyone
+        os.replace(stream.path, target)
+    return filename
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
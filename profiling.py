@@ -0,0 +1,138 @@
+"""
+Opt-in request profiler for production workers.
+
+A fraction of requests (PROFILE_RATE) run under cProfile. Those that take at
+least PROFILE_MIN_MS are saved as .prof files in PROFILE_DIR, and only the
+newest PROFILE_MAX_FILES are kept. The admin page /admin/profiles lists them
+for download. Open them with `python -m pstats <file>` or snakeviz.
+
+- Slow requests only: PROFILE_RATE=1 PROFILE_MIN_MS=500
+- A sample of all traffic: PROFILE_RATE=0.01 PROFILE_MIN_MS=0
+
+Under gevent every request of a worker runs on the same OS thread, and a
+profiler sees everything on its thread. So a worker profiles one request at a
+time, and pauses the profiler whenever gevent switches to another greenlet.
+The trace then only holds the work of the profiled request.
+"""
+import cProfile
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from flask import g, request
+from werkzeug.utils import secure_filename
+
+try:
+    import greenlet
+except ImportError: # Plain threads: cProfile is per thread already
+    greenlet = None
+
+_lock = threading.Lock() # One profiled request per process
+_config = {}
+
+def init_app(app):
+    app.config.setdefault('PROFILE_RATE', float(os.environ.get('PROFILE_RATE', 0))) # 0 disables profiling
+    app.config.setdefault('PROFILE_MIN_MS', float(os.environ.get('PROFILE_MIN_MS', 500)))
+    app.config.setdefault('PROFILE_DIR', os.environ.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles'))
+    app.config.setdefault('PROFILE_MAX_FILES', int(os.environ.get('PROFILE_MAX_FILES', 50)))
+    _config.update((key, app.config[key]) for key in ('PROFILE_RATE', 'PROFILE_MIN_MS', 'PROFILE_DIR', 'PROFILE_MAX_FILES'))
+    if app.config['PROFILE_RATE'] > 0:
+        app.before_request(start_profile)
+        app.teardown_request(finish_profile) # Also runs for errors, and after streamed responses end
+
+class RequestProfile:
+    """cProfile that only runs while the greenlet that started it is running."""
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.start = time.perf_counter()
+        self.owner = greenlet.getcurrent() if greenlet else None
+        self._previous_trace = None
+
+    def enable(self):
+        if self.owner is not None:
+            self._previous_trace = greenlet.settrace(self._on_switch)
+        self.profiler.enable()
+
+    def disable(self):
+        self.profiler.disable()
+        if self.owner is not None:
+            greenlet.settrace(self._previous_trace)
+        return (time.perf_counter() - self.start) * 1000
+
+    def _on_switch(self, event, args):
+        if event in ('switch', 'throw'):
+            origin, target = args
+            if origin is self.owner:
+                self.profiler.disable()
+            elif target is self.owner:
+                self.profiler.enable()
+        if self._previous_trace:
+            self._previous_trace(event, args)
+
+def start_profile():
+    if random.random() >= _config['PROFILE_RATE'] or not _lock.acquire(blocking=False):
+        return
+    profile = RequestProfile()
+    try:
+        profile.enable()
+    except ValueError: # Another profiler is active (e.g. under a debugger)
+        _lock.release()
+        return
+    g.request_profile = profile
+
+def finish_profile(exc=None):
+    profile = g.pop('request_profile', None)
+    if profile is None:
+        return
+    try:
+        elapsed_ms = profile.disable()
+    finally:
+        _lock.release()
+    if elapsed_ms >= _config['PROFILE_MIN_MS']:
+        save(profile.profiler, elapsed_ms, request.method, request.path)
+
+def save(profiler, elapsed_ms, method, path):
+    directory = _config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    # Everything the list page shows is in the name: time, duration, method and path
+    name = f"{stamp}_{elapsed_ms:.0f}ms_{method}_{secure_filename(path.strip('/').replace('/', '-')) or 'index'}"[:120]
+    filename = f"{name}_{os.getpid()}.prof"
+    try:
+        profiler.dump_stats(os.path.join(directory, filename))
+        _rotate(directory, _config['PROFILE_MAX_FILES'])
+    except OSError as e:
+        print(f"Could not save profile: {e}")
+
+def _rotate(directory, max_files):
+    files = sorted((entry for entry in os.scandir(directory) if entry.name.endswith('.prof')),
+                   key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in files[max_files:]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass # Another worker rotated it first
+
+def list_profiles(directory):
+    """Saved profiles, newest first, as dicts for the admin page."""
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for entry in os.scandir(directory):
+        if not entry.name.endswith('.prof'):
+            continue
+        parts = entry.name[:-len('.prof')].split('_')
+        stat = entry.stat()
+        profiles.append({
+            'name': entry.name,
+            'created_at': datetime.fromtimestamp(stat.st_mtime),
+            'duration_ms': parts[1][:-2] if len(parts) > 1 and parts[1].endswith('ms') else '',
+            'method': parts[2] if len(parts) > 2 else '',
+            'path': '/' + '_'.join(parts[3:-1]).replace('-', '/') if len(parts) > 4 else '',
+            'size': stat.st_size,
+        })
+    profiles.sort(key=lambda p: p['created_at'], reverse=True)
+    return profiles
@@ -0,0 +1,316 @@
+"""
+Local full-text search over post content (SQLite FTS5).
+
+Two indexes are kept:
+- post_fts, one row per post (titles and bodies in both languages), behind the
+  /search page and its JSON API.
+- post_chunk_fts, posts split into chunks (the summary, then body sections)
+  per language, with the title indexed in every chunk. The chat assistant
+  (/api/chat) is given the few chunks most relevant to the question instead
+  of the newest posts.
+
+Chinese is written without spaces, so CJK text is indexed as overlapping
+character bigrams ("缓存策略" -> "缓存 存策 策略"), which lets the standard
+unicode61 tokenizer match Chinese words of two or more characters. (The FTS5
+trigram tokenizer cannot match two-character words such as "缓存".)
+
+index_post() rewrites a post's rows in the same transaction as the post
+itself; `flask search reindex` rebuilds everything. On databases without FTS5
+the indexes are disabled and searches return nothing.
+"""
+import os
+import re
+from itertools import islice
+
+import click
+from flask import current_app
+from markupsafe import Markup, escape
+from flask.cli import AppGroup
+from sqlalchemy import text, or_
+from sqlalchemy.exc import OperationalError
+
+from models import db, Post
+from translation import split_markdown
+
+CHUNK_CHARS = 400 # Body chunk size, a paragraph or two
+ENTRY_TOKENS = 16 # Labels and URL around each chunk in the chat prompt
+CJK_RE = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+TERM_RE = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]+|[0-9A-Za-z\u00c0-\u024f]+')
+MAX_QUERY_TERMS = 32
+SNIPPET_CHARS = 160
+RANK_LIMIT = 2000 # Searches matching more posts than this are listed newest first (see search_posts)
+# Rows are keyed by rowid so a post's rows are found without scanning the table:
+# post_fts uses the post id, post_chunk_fts the range post_id * CHUNK_SLOTS + n
+CHUNK_SLOTS = 1000
+
+_available = None
+
+def init_app(app):
+    app.config.setdefault('CHAT_CONTEXT_TOKENS', int(os.environ.get('CHAT_CONTEXT_TOKENS', 600)))
+    app.config.setdefault('CHAT_CONTEXT_CHUNKS', int(os.environ.get('CHAT_CONTEXT_CHUNKS', 4)))
+    app.cli.add_command(search_cli)
+
+def terms(value):
+    """Index terms of `value`: lowercase words, and bigrams for runs of CJK characters."""
+    result = []
+    for match in TERM_RE.finditer(value or ''):
+        run = match.group()
+        if CJK_RE.match(run):
+            result.extend(run[i:i + 2] for i in range(max(1, len(run) - 1)))
+        else:
+            result.append(run.lower())
+    return result
+
+def estimate_tokens(value):
+    # Roughly one token per CJK character and per four other characters
+    cjk = len(CJK_RE.findall(value))
+    return cjk + (len(value) - cjk) // 4 + 1
+
+def available():
+    """
+    Whether the index tables exist. Checked on first use in each process that
+    didn't create them with ensure_index() (needs an app context).
+    """
+    global _available
+    if _available is None:
+        _available = db.engine.dialect.name == 'sqlite' and db.session.execute(text(
+            "SELECT count(*) FROM sqlite_master WHERE name IN ('post_fts', 'post_chunk_fts')"
+        )).scalar() == 2
+    return _available
+
+def ensure_index():
+    """Creates the index tables if needed (filling them from existing posts). Needs an app context."""
+    global _available
+    if db.engine.dialect.name != 'sqlite':
+        _available = False
+        return
+    existing = db.session.execute(text(
+        "SELECT count(*) FROM sqlite_master WHERE name IN ('post_fts', 'post_chunk_fts')"
+    )).scalar()
+    try:
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(title, body)"
+        ))
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS post_chunk_fts USING fts5("
+            "terms, post_id UNINDEXED, lang UNINDEXED, title UNINDEXED, chunk UNINDEXED)"
+        ))
+        db.session.commit()
+    except OperationalError as e:
+        db.session.rollback()
+        print(f"Search index disabled (SQLite without FTS5?): {e}")
+        _available = False
+        return
+    _available = True
+    if existing < 2:
+        count = reindex_all()
+        if count:
+            print(f"Built search index for {count} posts.")
+
+def post_chunks(post):
+    """Yields (lang, title, chunk) for everything of `post` worth retrieving."""
+    versions = [('zh', post.title, post.summary_zh, post.content)]
+    if post.content_en or post.title_en:
+        versions.append(('en', post.title_en or post.title, post.summary_en, post.content_en))
+    for lang, title, summary, content in versions:
+        chunks = [chunk.strip() for translatable, chunk in split_markdown(content or '', CHUNK_CHARS)
+                  if translatable and chunk.strip()]
+        if chunks:
+            if summary:
+                yield lang, title, summary
+        elif title or summary:
+            # Nothing but code or images in the body: the title and summary stand in for it
+            yield lang, title, '\n'.join(part for part in (title, summary) if part)
+        for chunk in chunks:
+            yield lang, title, chunk
+
+def index_terms(*values):
+    return ' '.join(terms('\n'.join(value for value in values if value)))
+
+def _insert(post):
+    db.session.execute(text("INSERT INTO post_fts (rowid, title, body) VALUES (:post_id, :title, :body)"), {
+        'post_id': post.id,
+        'title': index_terms(post.title, post.title_en),
+        'body': index_terms(post.content, post.content_en),
+    })
+    rows = [
+        {'rowid': post.id * CHUNK_SLOTS + n, 'terms': ' '.join(terms(f"{title}\n{chunk}")), 'post_id': post.id,
+         'lang': lang, 'title': title, 'chunk': chunk}
+        for n, (lang, title, chunk) in enumerate(islice(post_chunks(post), CHUNK_SLOTS))
+    ]
+    if rows:
+        db.session.execute(text(
+            "INSERT INTO post_chunk_fts (rowid, terms, post_id, lang, title, chunk) "
+            "VALUES (:rowid, :terms, :post_id, :lang, :title, :chunk)"
+        ), rows)
+
+def index_post(post):
+    """Rewrites the chunks of `post`. Call before committing the post."""
+    if not available():
+        return
+    if post.id is None:
+        db.session.flush()
+    remove_post(post.id)
+    _insert(post)
+
+def remove_post(post_id):
+    if not available():
+        return
+    db.session.execute(text("DELETE FROM post_fts WHERE rowid = :post_id"), {'post_id': post_id})
+    db.session.execute(text("DELETE FROM post_chunk_fts WHERE rowid BETWEEN :first AND :last"),
+                       {'first': post_id * CHUNK_SLOTS, 'last': post_id * CHUNK_SLOTS + CHUNK_SLOTS - 1})
+
+def reindex_all():
+    db.session.execute(text("DELETE FROM post_fts"))
+    db.session.execute(text("DELETE FROM post_chunk_fts"))
+    count = 0
+    for post in Post.query.order_by(Post.id).yield_per(100):
+        _insert(post)
+        count += 1
+    db.session.commit()
+    return count
+
+def match_query(question):
+    """FTS5 query matching any term of `question`, or None if it has no usable terms."""
+    unique = list(dict.fromkeys(t for t in terms(question) if len(t) > 1))[:MAX_QUERY_TERMS]
+    if not unique:
+        return None
+    return ' OR '.join(f'"{t}"' for t in unique)
+
+def retrieve(question, limit=None, token_budget=None):
+    """
+    The chunks most relevant to `question`, best first, as dicts with post_id,
+    lang, title and chunk, stopping at `limit` chunks or `token_budget` tokens.
+    """
+    limit = limit or current_app.config['CHAT_CONTEXT_CHUNKS']
+    token_budget = token_budget or current_app.config['CHAT_CONTEXT_TOKENS']
+    query = match_query(question)
+    if not available() or not query:
+        return []
+    rows = db.session.execute(text(
+        "SELECT post_id, lang, title, chunk FROM post_chunk_fts WHERE post_chunk_fts MATCH :query "
+        "ORDER BY bm25(post_chunk_fts) LIMIT :limit"
+    ), {'query': query, 'limit': limit}).mappings().all()
+    chunks = []
+    used = 0
+    for row in rows:
+        overhead = estimate_tokens(row['title'] or '') + ENTRY_TOKENS
+        cost = overhead + estimate_tokens(row['chunk'])
+        if used + cost > token_budget:
+            if chunks:
+                break
+            # Always keep the best match, cut to the budget
+            row = dict(row, chunk=row['chunk'][:max(1, token_budget - overhead)])
+            cost = token_budget
+        chunks.append(dict(row))
+        used += cost
+    return chunks
+
+def search_query(q):
+    """
+    FTS5 query requiring every word of `q`: CJK runs as phrases of their bigrams
+    (so they match as a substring), other words as prefixes ("cache" finds "caching").
+    Returns None if nothing searchable is left.
+    """
+    parts = []
+    for match in list(TERM_RE.finditer(q or ''))[:MAX_QUERY_TERMS]:
+        run = match.group()
+        if CJK_RE.match(run):
+            if len(run) > 1:
+                parts.append('"' + ' '.join(run[i:i + 2] for i in range(len(run) - 1)) + '"')
+        elif len(run) > 1:
+            parts.append(f'"{run.lower()}"*')
+        else:
+            parts.append(f'"{run.lower()}"')
+    return ' '.join(parts) or None
+
+def search_posts(q, page=1, per_page=10):
+    """
+    Returns (post ids best first, has_next) for one page of results.
+    Ranking by relevance costs time per matching post, and says little when a word
+    appears in most posts, so searches matching more than RANK_LIMIT posts are
+    listed newest first instead, which FTS5 can stop after one page.
+    """
+    if any(len(run) == 1 and CJK_RE.match(run) for run in _runs(q)):
+        return _like_search(q, page, per_page)
+    query = search_query(q)
+    if not available() or not query:
+        return [], False
+    params = {'query': query, 'limit': per_page + 1, 'offset': (page - 1) * per_page}
+    matches = db.session.execute(text(
+        "SELECT count(*) FROM (SELECT rowid FROM post_fts WHERE post_fts MATCH :query LIMIT :cap)"
+    ), {'query': query, 'cap': RANK_LIMIT + 1}).scalar()
+    # Title matches weigh five times as much as body matches
+    order = 'bm25(post_fts, 5.0, 1.0)' if matches <= RANK_LIMIT else 'rowid DESC'
+    ids = db.session.execute(text(
+        f"SELECT rowid FROM post_fts WHERE post_fts MATCH :query ORDER BY {order} LIMIT :limit OFFSET :offset"
+    ), params).scalars().all()
+    return ids[:per_page], len(ids) > per_page
+
+def _runs(q):
+    return [match.group() for match in TERM_RE.finditer(q or '')][:MAX_QUERY_TERMS]
+
+def _like_search(q, page, per_page):
+    """
+    search_posts() for queries with a one-character Chinese word ("段"), which the
+    bigram index cannot find inside longer words ("片段"): every word must appear in
+    a title or body, newest first. This scans the posts, so it is kept to these queries.
+    """
+    conditions = [
+        or_(*(column.like(f'%{run}%') for column in (Post.title, Post.title_en, Post.content, Post.content_en)))
+        for run in _runs(q)
+    ]
+    ids = [post_id for (post_id,) in Post.query.with_entities(Post.id).filter(*conditions)
+           .order_by(Post.created_at.desc(), Post.id.desc()).limit(per_page + 1).offset((page - 1) * per_page)]
+    return ids[:per_page], len(ids) > per_page
+
+def _word_pattern(q):
+    words = set(_runs(q))
+    if not words:
+        return None
+    return re.compile('|'.join(re.escape(w) for w in sorted(words, key=len, reverse=True)), re.IGNORECASE)
+
+def highlight(value, q):
+    """`value` escaped, with the words of `q` wrapped in <mark>."""
+    pattern = _word_pattern(q)
+    value = value or ''
+    if not pattern:
+        return escape(value)
+    parts = []
+    last = 0
+    for match in pattern.finditer(value):
+        parts.append(escape(value[last:match.start()]))
+        parts.append(Markup('<mark>%s</mark>') % match.group())
+        last = match.end()
+    parts.append(escape(value[last:]))
+    return Markup('').join(parts)
+
+def snippet(value, q, length=SNIPPET_CHARS):
+    """
+    A highlighted excerpt of `value` around the first match of `q`, or None if
+    it does not contain any of the words.
+    """
+    pattern = _word_pattern(q)
+    value = re.sub(r'\s+', ' ', value or '')
+    match = pattern.search(value) if pattern else None
+    if not match:
+        return None
+    start = max(0, match.start() - length // 3)
+    end = min(len(value), start + length)
+    result = highlight(value[start:end], q)
+    if start > 0:
+        result = Markup('…') + result
+    if end < len(value):
+        result += Markup('…')
+    return result
+
+search_cli = AppGroup('search', help='Manage the full-text search index.')
+
+@search_cli.command('reindex')
+def reindex_command():
+    """Rebuild the search index from all posts."""
+    ensure_index()
+    if not available():
+        click.echo('Full-text search is not available on this database.')
+        return
+    click.echo(f"Indexed {reindex_all()} posts.")
@@ -0,0 +1,192 @@
+"""
+Static export of the reader pages, for nginx to serve without the app.
+
+The home page, each category listing, each post, /about and /gallery are
+rendered once per theme and language into STATIC_EXPORT_DIR:
+
+    <dir>/<theme>/<lang>/index.html
+    <dir>/<theme>/<lang>/category/<id>/index.html
+    <dir>/<theme>/<lang>/post/<id>/index.html
+    <dir>/<theme>/<lang>/about/index.html
+    <dir>/<theme>/<lang>/gallery/index.html
+    <dir>/site -> the theme readers get when they haven't picked one
+
+Theme and language live in the signed session cookie, which nginx can't read,
+so every app response also sets a plain `static_variant` cookie ("site/zh",
+"simple_white/en", ...). The cookie is dropped for the logged-in admin and
+while a flash message is pending, because those pages differ. Visitors without
+the cookie, and pages that were not exported, fall through to the app.
+
+Writes queue export jobs on the job queue that rebuild only the pages they
+affect. `flask static-site build` does a full rebuild.
+"""
+import os
+import time
+
+import click
+from flask import current_app, request, session
+from flask.cli import AppGroup
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException
+
+from cache import atomic_write
+from models import db, Post, Category
+
+THEMES = ['code_black', 'simple_white']
+LANGS = ['zh', 'en']
+SITE_THEME = 'site' # Symlink to the site's default theme
+COOKIE = 'static_variant'
+
+class StaticSite:
+    def __init__(self, app=None, resolve_theme=None):
+        self.app = None
+        self.resolve_theme = resolve_theme # Theme folder of the current request
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('STATIC_EXPORT_DIR', os.environ.get('STATIC_EXPORT_DIR', '')) # Empty disables the export
+        self.app = app
+        app.extensions['static_site'] = self
+        app.cli.add_command(static_cli)
+        if self.enabled:
+            app.after_request(self.set_variant_cookie)
+
+    @property
+    def enabled(self):
+        return bool(self.app.config['STATIC_EXPORT_DIR'])
+
+    def set_variant_cookie(self, response):
+        variant = None
+        if not current_user.is_authenticated and '_flashes' not in session:
+            theme = session.get('theme') or SITE_THEME
+            lang = session.get('lang', 'zh')
+            if theme in THEMES + [SITE_THEME] and lang in LANGS:
+                variant = f"{theme}/{lang}"
+        current = request.cookies.get(COOKIE)
+        if variant and variant != current:
+            response.set_cookie(COOKIE, variant, max_age=self.app.config['PERMANENT_SESSION_LIFETIME'], samesite='Lax')
+        elif not variant and current:
+            response.delete_cookie(COOKIE)
+        return response
+
+    # Pages, as URLs
+
+    def home_pages(self):
+        return ['/'] + [f'/?category={category_id}' for (category_id,) in db.session.query(Category.id)]
+
+    def all_pages(self):
+        posts = [f'/post/{post_id}' for (post_id,) in db.session.query(Post.id)]
+        return self.home_pages() + posts + ['/about', '/gallery']
+
+    # Rendering
+
+    def render(self, url, theme, lang):
+        """The page body as the anonymous reader with this theme and language sees it, or None for a 404."""
+        with self.app.test_request_context(url):
+            session['theme'] = theme
+            session['lang'] = lang
+            try:
+                rv = self.app.view_functions[request.endpoint](**request.view_args)
+            except HTTPException:
+                return None
+            return self.app.make_response(rv).get_data()
+
+    def export(self, pages, directory=None):
+        """Renders `pages` in every theme and language. Returns the set of files written."""
+        directory = directory or self.app.config['STATIC_EXPORT_DIR']
+        written = set()
+        if not directory:
+            return written # Export disabled: never write relative to the working directory
+        for theme in THEMES:
+            for lang in LANGS:
+                for url in pages:
+                    target = os.path.join(directory, theme, lang, page_path(url))
+                    body = self.render(url, theme, lang)
+                    if body is None:
+                        _remove(target)
+                    else:
+                        _write(target, body)
+                        written.add(target)
+                    time.sleep(0) # Rendering is CPU-bound: let other greenlets of this worker run
+        self.link_site_theme(directory)
+        return written
+
+    def link_site_theme(self, directory):
+        with self.app.test_request_context('/'):
+            theme = self.resolve_theme()
+        link = os.path.join(directory, SITE_THEME)
+        if os.path.islink(link) and os.readlink(link) == theme:
+            return
+        tmp = f"{link}.{os.getpid()}.tmp"
+        _remove(tmp)
+        os.symlink(theme, tmp)
+        os.replace(tmp, link) # Atomic, so nginx never sees it missing
+
+    # Full and incremental builds, run by the CLI and the export jobs
+
+    def build(self, directory=None):
+        """Exports every page and removes pages of deleted posts and categories. Returns the page count."""
+        directory = directory or self.app.config['STATIC_EXPORT_DIR']
+        if not directory:
+            return 0
+        written = self.export(self.all_pages(), directory)
+        for theme in THEMES:
+            for root, dirs, files in os.walk(os.path.join(directory, theme), topdown=False):
+                for name in files:
+                    if not name.endswith('.tmp') and os.path.join(root, name) not in written:
+                        _remove(os.path.join(root, name))
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass # Not empty
+        return len(written)
+
+    def export_post(self, post_id):
+        """
+        The post's page (removed if it was deleted), the home page and its category's
+        listing. A listing the post left (moved or deleted) is queued by the caller
+        as export_category.
+        """
+        pages = [f'/post/{post_id}', '/']
+        category_id = db.session.query(Post.category_id).filter_by(id=post_id).scalar()
+        if category_id:
+            pages.append(f'/?category={category_id}')
+        self.export(pages)
+
+    def export_category(self, category_id):
+        self.export([f'/?category={category_id}'])
+
+    def export_page(self, url):
+        self.export([url])
+
+def page_path(url):
+    """File of a page URL within a variant directory: '/?category=3' -> 'category/3/index.html'."""
+    path, _, query = url.partition('?')
+    if query:
+        path = '/category/' + query.split('=', 1)[1]
+    return os.path.join(path.strip('/'), 'index.html')
+
+def _write(path, body):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    atomic_write(path, body)
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+static_cli = AppGroup('static-site', help='Export reader pages as static files.')
+
+@static_cli.command('build')
+@click.option('--output', help='Directory to export to (default: STATIC_EXPORT_DIR).')
+def build_command(output):
+    """Render every reader page in every theme and language."""
+    site = current_app.extensions['static_site']
+    directory = output or current_app.config['STATIC_EXPORT_DIR']
+    if not directory:
+        raise click.UsageError('Set STATIC_EXPORT_DIR or pass --output.')
+    start = time.perf_counter()
+    count = site.build(os.path.abspath(directory))
+    print(f"Exported {count} pages to {directory} in {time.perf_counter() - start:.1f}s.")
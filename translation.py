@@ -0,0 +1,109 @@
+"""
+Block-level translation of Markdown.
+
+A post body is split into blocks: one per heading section, with long sections
+cut further at paragraph breaks. Fenced code blocks are kept out of the blocks
+and copied through untranslated. Each block is translated on its own, in
+parallel, and cached by the hash of its text (ai_cache.py). After an edit, only
+blocks whose text changed go back to the API; the rest of the translation is
+reassembled from the cache.
+"""
+import re
+from concurrent.futures import as_completed
+
+import ai_cache
+
+MAX_BLOCK_CHARS = 2000 # Sections longer than this are split at blank lines
+FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+HEADING_RE = re.compile(r'^ {0,3}#{1,6}(\s|$)')
+
+def split_markdown(text, max_chars=MAX_BLOCK_CHARS):
+    """
+    Returns a list of (translatable, chunk). Joining the chunks gives back
+    `text` exactly; fenced code chunks are marked not translatable.
+    """
+    blocks = []
+    section = []
+    fence = None
+
+    def flush_section():
+        if section:
+            blocks.extend((True, chunk) for chunk in _limit_size(''.join(section), max_chars))
+            section.clear()
+
+    code = []
+    for line in text.splitlines(keepends=True):
+        if fence:
+            code.append(line)
+            stripped = line.strip()
+            if stripped.startswith(fence) and not stripped.strip(fence[0]):
+                blocks.append((False, ''.join(code)))
+                code, fence = [], None
+            continue
+        match = FENCE_RE.match(line)
+        if match:
+            flush_section()
+            fence = match.group(1)
+            code = [line]
+        elif HEADING_RE.match(line) and ''.join(section).strip():
+            flush_section()
+            section.append(line)
+        else:
+            section.append(line)
+    if code:
+        blocks.append((False, ''.join(code))) # Unclosed fence runs to the end, as in Markdown
+    flush_section()
+    return blocks
+
+def _limit_size(text, max_chars):
+    if len(text) <= max_chars:
+        return [text]
+    # Paragraphs keep their trailing blank lines, so the chunks still join back to `text`
+    paragraphs = re.split(r'(?<=\n\n)(?=[^\n])', text)
+    chunks = ['']
+    for paragraph in paragraphs:
+        if chunks[-1] and len(chunks[-1]) + len(paragraph) > max_chars:
+            chunks.append('')
+        chunks[-1] += paragraph
+    return chunks
+
+def _core(chunk):
+    """Splits a chunk into (leading whitespace, text to translate, trailing whitespace)."""
+    core = chunk.strip()
+    if not core:
+        return chunk, '', ''
+    start = chunk.index(core)
+    return chunk[:start], core, chunk[start + len(core):]
+
+def translate_markdown(text, translate, executor, op='translate', lang='en', prompt_version=1):
+    """
+    Translates Markdown `text` block by block with `translate(block_text)`.
+    Cached blocks are reused; the others are translated concurrently on `executor`
+    and cached as soon as each one returns, so a failure only loses the blocks
+    that failed. Needs an app context (for the cache).
+    """
+    blocks = split_markdown(text)
+    cores = {_core(chunk)[1] for translatable, chunk in blocks if translatable} - {''}
+    translated = ai_cache.lookup(op, lang, prompt_version, cores)
+
+    futures = {executor.submit(translate, core): core for core in cores - translated.keys()}
+    error = None
+    for future in as_completed(futures):
+        try:
+            output = future.result()
+        except Exception as e:
+            error = error or e
+            continue
+        translated[futures[future]] = output
+        ai_cache.store(op, lang, prompt_version, futures[future], output)
+    if error:
+        raise error
+
+    parts = []
+    for translatable, chunk in blocks:
+        lead, core, trail = _core(chunk)
+        if translatable and core:
+            parts.append(lead + translated[core].strip() + trail)
+        else:
+            parts.append(chunk)
+    return ''.join(parts)